@@ -0,0 +1,70 @@
+"""Check that the entry points of the scripts import within a time budget.
+
+    python -m scripts.benchmarks.imports
+
+Each entry point is imported in a fresh interpreter with `-X importtime`. The
+check fails if the cumulative import time of an entry point is over its budget,
+or if importing it loads any of the LAZY dependencies, which should only be
+imported by the functions that use them."""
+
+import json
+import subprocess
+import sys
+
+from scripts import config
+
+# Maximum import time, in seconds, of each entry point
+BUDGETS: dict = {
+    "scripts.update_tracker": 1.5,
+    "scripts.full_update": 2.5,
+}
+
+# Dependencies that must not be loaded at import time
+LAZY: list = ["oda_data", "bblocks"]
+
+
+def import_time(module: str) -> tuple[float, list[str]]:
+    """Import `module` in a new interpreter. Returns its cumulative import time
+    in seconds and the LAZY dependencies it loaded"""
+    code = (
+        f"import sys, json, {module}; "
+        f"print(json.dumps([m for m in {LAZY!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=config.PATHS.project,
+    )
+
+    # -X importtime writes "import time: self [us] | cumulative | package" lines
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|")
+        if name.strip() == module:
+            cumulative = int(total)
+
+    return cumulative / 1e6, json.loads(result.stdout.splitlines()[-1])
+
+
+def check_imports() -> bool:
+    """Check every entry point in BUDGETS, printing the results"""
+    passed = True
+
+    for module, budget in BUDGETS.items():
+        seconds, loaded = import_time(module)
+        ok = seconds <= budget and not loaded
+        passed &= ok
+
+        print(f"{'ok' if ok else 'FAIL':<5}{module}: {seconds:.2f}s (budget {budget}s)")
+        if loaded:
+            print(f"     imported at module level: {', '.join(loaded)}")
+
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_imports() else 1)
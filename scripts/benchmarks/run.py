@@ -0,0 +1,181 @@
+"""Time the data pipelines on synthetic data of increasing size.
+
+    python -m scripts.benchmarks.run --sizes 10000 100000 1000000
+
+The synthetic data is written to a temporary raw_data folder, so the real data
+is never touched. Every benchmark is run a few times at each size and the best
+time is kept. Results are appended to scripts/benchmarks/results.csv, one row per
+benchmark and size, tagged with the current commit so that runs can be compared."""
+
+import argparse
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from scripts import config, readers
+from scripts.benchmarks import synthetic
+from scripts.logger import logger
+from scripts.multilateral_spending import spending_data, wb_scolly
+from scripts.world_bank_finances import balance_sheet, lending, loans_data
+from scripts.world_bank_votes import download_shares
+
+RESULTS_FILE: Path = config.PATHS.scripts / "benchmarks" / "results.csv"
+
+SIZES: list = [10_000, 100_000, 1_000_000]
+
+
+def _save_loans(rows: int) -> None:
+    synthetic.loan_history(rows).to_feather(
+        config.PATHS.raw_data / f"{loans_data.file_name}_data.feather"
+    )
+    loans_data.build_lending_cube(loans_data.file_name)
+
+
+def _save_balance_sheet(rows: int) -> None:
+    synthetic.balance_sheet(rows).to_feather(
+        config.PATHS.raw_data / f"{balance_sheet.file_name}_data.feather"
+    )
+
+
+def _crs(rows: int) -> pd.DataFrame:
+    return synthetic.crs(rows)
+
+
+def _mdb(rows: int) -> pd.DataFrame:
+    return spending_data._process_crs(synthetic.crs(rows), config.MULTILATERALS)
+
+
+def _wb(rows: int) -> pd.DataFrame:
+    return (
+        _mdb(rows)
+        .loc[lambda d: d.year == d.year.max()]
+        .assign(donor="World Bank Group")
+    )
+
+
+def _snapshots() -> list[str]:
+    return [f"{d:%Y-%m-%d}" for d in synthetic.snapshot_dates(60)]
+
+
+# name -> (prepare(rows), run(prepared)). `prepare` is not timed, and whatever it
+# returns is passed to `run`.
+BENCHMARKS: dict[str, tuple[Callable, Callable]] = {
+    "loans_data.build_lending_cube": (
+        _save_loans,
+        lambda _: loans_data.build_lending_cube(loans_data.file_name),
+    ),
+    "lending.cumulative_lending": (
+        _save_loans,
+        lambda _: lending.cumulative_lending(_snapshots()),
+    ),
+    "lending.yearly_snapshot": (_save_loans, lambda _: lending.yearly_snapshot()),
+    "lending.country_flows": (_save_loans, lambda _: lending.country_flows()),
+    "balance_sheet.el_ratio": (_save_balance_sheet, lambda _: balance_sheet.el_ratio()),
+    "balance_sheet.gearing_ratio": (
+        _save_balance_sheet,
+        lambda _: balance_sheet.gearing_ratio(),
+    ),
+    "spending_data._process_crs": (
+        _crs,
+        lambda df: spending_data._process_crs(df, config.MULTILATERALS),
+    ),
+    "wb_scolly._sector_summary": (_wb, wb_scolly._sector_summary),
+    "wb_scolly._flow_region_recipient_summary": (
+        _wb,
+        wb_scolly._flow_region_recipient_summary,
+    ),
+    "download_shares._top_and_groups": (
+        synthetic.voting_shares,
+        lambda df: download_shares._top_and_groups(df, top=9),
+    ),
+    "download_shares._sort_by_income": (
+        synthetic.voting_shares,
+        lambda df: download_shares._sort_by_income(
+            df, {d: (d, synthetic.INCOME_LEVELS) for d in df.dataset.unique()}
+        ),
+    ),
+}
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=config.PATHS.project,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _time(run: Callable, prepared, repeat: int) -> float:
+    """Best wall time of `repeat` runs, each starting with an empty reader cache"""
+    times = []
+    for _ in range(repeat):
+        readers.clear_cache()
+        start = time.perf_counter()
+        run(prepared)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_benchmarks(
+    sizes: list[int] = None, names: list[str] = None, repeat: int = 3
+) -> pd.DataFrame:
+    """Run the benchmarks at every size and append the results to RESULTS_FILE"""
+    sizes = sizes or SIZES
+    names = names or list(BENCHMARKS)
+
+    commit, timestamp = _commit(), datetime.now().isoformat(timespec="seconds")
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Point the scripts to a temporary raw_data folder
+        raw_data, cache = config.PATHS.raw_data, config.PATHS.cache
+        config.PATHS.raw_data = Path(tmp)
+        config.PATHS.cache = Path(tmp) / ".cache"
+
+        try:
+            for rows in sizes:
+                for name in names:
+                    prepare, run = BENCHMARKS[name]
+                    seconds = _time(run, prepare(rows), repeat)
+                    logger.debug(f"{name} ({rows:,} rows): {seconds:.4f}s")
+                    results.append(
+                        {
+                            "timestamp": timestamp,
+                            "commit": commit,
+                            "benchmark": name,
+                            "rows": rows,
+                            "seconds": round(seconds, 6),
+                        }
+                    )
+        finally:
+            config.PATHS.raw_data, config.PATHS.cache = raw_data, cache
+            readers.clear_cache()
+
+    df = pd.DataFrame(results)
+    df.to_csv(RESULTS_FILE, mode="a", header=not RESULTS_FILE.exists(), index=False)
+
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        run_benchmarks(args.sizes, args.benchmarks, args.repeat)
+        .pivot(index="benchmark", columns="rows", values="seconds")
+        .to_string()
+    )
@@ -0,0 +1,165 @@
+"""Synthetic versions of the datasets used by the scripts, at any size.
+
+The data follows the schemas of the real datasets: the loan history uses the
+dtype map in world_bank_finances.download, the balance sheet uses the categories
+in balance_sheet.INDICATORS, the CRS data has the columns requested by
+spending_data and the voting shares have the columns produced by
+download_shares.clean_data."""
+
+import numpy as np
+import pandas as pd
+
+from scripts.config import MULTILATERALS
+from scripts.world_bank_finances.balance_sheet import INDICATORS
+from scripts.world_bank_finances.download import DTYPES
+
+LOAN_STATUSES: list = [
+    "Repaid",
+    "Disbursing",
+    "Disbursed",
+    "Fully Repaid",
+    "Draft",
+    "Cancelled",
+    "Fully Cancelled",
+    "Fully Transferred",
+    "Terminated",
+    "Approved",
+    "Signed",
+]
+
+INCOME_LEVELS: list = [
+    "High income",
+    "Upper middle income",
+    "Lower middle income",
+    "Low income",
+]
+
+
+def _labels(prefix: str, count: int) -> np.ndarray:
+    return np.array([f"{prefix} {i}" for i in range(count)])
+
+
+def snapshot_dates(count: int) -> pd.DatetimeIndex:
+    """Quarterly snapshot dates, ending on 2023-06-30"""
+    return pd.date_range(end="2023-06-30", periods=count, freq="Q")
+
+
+def loan_history(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A loan history with the columns and dtypes of the IBRD loan history.
+    Each loan appears once per quarterly snapshot."""
+    rng = np.random.default_rng(seed)
+
+    snapshots = snapshot_dates(max(4, min(60, rows // 1_000)))
+    loans = max(1, rows // len(snapshots))
+    loan = np.arange(rows) % loans
+    countries = _labels("Country", 150)
+
+    data = {}
+    for column, dtype in DTYPES.items():
+        if column == "end_of_period":
+            data[column] = snapshots[
+                np.minimum(np.arange(rows) // loans, len(snapshots) - 1)
+            ]
+        elif column in ("country", "borrower", "guarantor"):
+            data[column] = countries[loan % len(countries)]
+        elif column in ("loan_number", "project_id", "project_name_"):
+            data[column] = np.char.add(f"{column} ", loan.astype("str"))
+        elif column == "loan_status":
+            data[column] = rng.choice(LOAN_STATUSES, rows)
+        elif dtype == "category":
+            data[column] = rng.choice(_labels(column, 20), rows)
+        elif dtype == "float64":
+            data[column] = rng.gamma(2.0, 5e6, rows)
+        else:
+            data[column] = pd.Timestamp("1990-01-01") + pd.to_timedelta(
+                rng.integers(0, 12_000, rows), unit="D"
+            )
+
+    return pd.DataFrame(data).astype(DTYPES)
+
+
+def balance_sheet(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A balance sheet with the schema of the raw data (every column a string).
+    Each of the last 30 years has one row per indicator, and the remaining rows
+    are spread over other line items."""
+    rng = np.random.default_rng(seed)
+
+    years = pd.date_range(end="2023-06-30", periods=30, freq="12M")
+    others = max(0, rows // len(years) - len(INDICATORS))
+    categories = np.array(list(INDICATORS.values()) + list(_labels("Other", others)))
+
+    year = np.repeat(years.strftime("%Y-%m-%dT00:00:00.000"), len(categories))
+    category = np.tile(categories, len(years))
+
+    return pd.DataFrame(
+        {
+            "classification": "Assets",
+            "grouping": "Grouping",
+            "final_category": category,
+            "category": category,
+            "line_item_description": category,
+            "year": year,
+            "amount": rng.integers(1, 400_000, len(year)).astype("str"),
+        }
+    )
+
+
+def crs(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Bilateral CRS flows with the columns requested by spending_data, for the
+    multilateral donors in config.MULTILATERALS and a few others"""
+    rng = np.random.default_rng(seed)
+
+    donors = list(MULTILATERALS) + [1, 2, 3, 4]
+    recipients = rng.integers(1, 1_000, 150)
+
+    recipient = rng.choice(recipients, rows)
+
+    return pd.DataFrame(
+        {
+            "year": rng.integers(2015, 2021, rows),
+            "indicator": "crs_bilateral_all_flows_disbursement_gross",
+            "donor_code": pd.array(rng.choice(donors, rows), dtype="Int16"),
+            "agency_code": pd.array(rng.integers(1, 6, rows), dtype="Int16"),
+            "recipient_code": pd.array(recipient, dtype="Int16"),
+            "recipient_name": pd.Categorical(
+                np.char.add("Recipient ", recipient.astype("str"))
+            ),
+            "region_code": rng.choice(
+                [10001, 10003, 10006, 10007, 10009, 10010, 15006, 298, 798], rows
+            ),
+            "sector_code": rng.integers(110, 1000, rows),
+            "flow_code": rng.choice([11, 13, 14, 19], rows),
+            "currency": "USD",
+            "prices": "current",
+            "value": rng.gamma(1.5, 2.0, rows) - 0.5,
+        }
+    )
+
+
+def voting_shares(rows: int, institutions: int = 2, seed: int = 0) -> pd.DataFrame:
+    """Clean voting shares (as returned by download_shares.clean_data) for a number
+    of institutions, with `rows` members each"""
+    rng = np.random.default_rng(seed)
+
+    names = np.concatenate([["China", "India"], _labels("Member", max(0, rows - 2))])[
+        :rows
+    ]
+
+    frames = []
+    for i in range(institutions):
+        votes = rng.pareto(1.5, rows)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "name": names,
+                    "Votes Share": (100 * votes / votes.sum()).round(2),
+                    "population": rng.integers(100_000, 1_000_000_000, rows).astype(
+                        "float64"
+                    ),
+                    "income_level": rng.choice(INCOME_LEVELS, rows),
+                    "dataset": f"Institution {i}",
+                }
+            )
+        )
+
+    return pd.concat(frames, ignore_index=True)
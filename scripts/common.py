@@ -1,21 +1,190 @@
+import hashlib
 import json
+from contextlib import contextmanager
+from functools import cache
 from pathlib import Path
+from typing import Callable, Iterator
 import os
 
+import pandas as pd
 
-def update_key_number(path: str | Path, new_dict: dict) -> None:
-    """Update a key number json by updating it with a new dictionary"""
+from scripts import config
+from scripts.logger import logger
+
+# Number of outputs of each name kept by parquet_cache
+CACHE_ENTRIES: int = 4
+
+# Key numbers files already read, with their modification time
+_key_numbers: dict[Path, tuple[int, dict]] = {}
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on `path`, across threads and processes. The lock
+    file is kept in PATHS.cache, so that it doesn't end up next to the outputs"""
+    lock_path = config.PATHS.cache / "locks" / f"{path.name}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(lock_path, "w") as lock:
+        if os.name == "nt":
+            import msvcrt
+
+            # Locks the first byte of the file. LK_LOCK retries for about 10
+            # seconds, then raises an OSError
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_json(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def update_key_numbers(path: str | Path, new_dict: dict) -> None:
+    """Add or replace key numbers in a json file. The file is read, updated and
+    replaced atomically under a lock, so concurrent updates don't drop each
+    other's keys"""
+    path = Path(path)
+
+    with _file_lock(path):
+        data = _read_json(path) | new_dict
+
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=4)
+        tmp.replace(path)
+
+
+@contextmanager
+def key_numbers(path: str | Path) -> Iterator[dict]:
+    """Collect key numbers in a dictionary and write them in a single update
+    when the block exits without errors:
+
+        with key_numbers(path) as numbers:
+            numbers["ida_date"] = ...
+
+    Updates are batched within a block, not across pipeline stages: each stage
+    commits its own locked write. Stages can run in separate processes, so a
+    shared in-memory store would need them to send their keys back to the
+    runner. Locked writes are enough to keep concurrent stages from dropping
+    each other's keys. With one write per stage, a stage that fails doesn't
+    hold back the keys of the stages that succeeded."""
+    numbers = {}
+    yield numbers
+    if numbers:
+        update_key_numbers(path, numbers)
+
+
+def read_key_numbers(path: str | Path) -> dict:
+    """Read a key numbers json file. The file is parsed again only if it changed
+    since the last read"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+
+    modified = path.stat().st_mtime_ns
+    cached = _key_numbers.get(path)
+    if cached is None or cached[0] != modified:
+        cached = _key_numbers[path] = (modified, _read_json(path))
+
+    return dict(cached[1])
+
+
+@cache
+def init_oda_data() -> None:
+    """Import oda_data and point it to PATHS.raw_data. oda_data (like bblocks) is
+    slow to import, so it is imported on first use rather than at module level"""
+    from oda_data import set_data_path
+
+    set_data_path(config.PATHS.raw_data)
+
+
+@cache
+def init_bblocks() -> None:
+    """Import bblocks and point it to PATHS.raw_data"""
+    from bblocks import set_bblocks_data_path
+
+    set_bblocks_data_path(config.PATHS.raw_data)
+
+
+def data_vintage(source: str) -> str | None:
+    """Return the date a data source was last updated, as recorded in
+    raw_data/data_updates.json"""
+    path = config.PATHS.raw_data / "data_updates.json"
 
-    # Check if the file exists, if not create
     if not os.path.exists(path):
-        with open(path, "w") as f:
-            json.dump({}, f)
+        return None
 
     with open(path, "r") as f:
-        data = json.load(f)
+        return json.load(f).get(source)
+
+
+def fingerprint(paths: list[Path]) -> str | None:
+    """Hash the content of files (and of every file inside folders). Returns None
+    if any of them is missing"""
+    digest = hashlib.sha256()
+
+    for path in sorted(Path(p) for p in paths):
+        if not path.exists():
+            return None
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for file in (f for f in files if f.is_file()):
+            digest.update(str(file).encode())
+            digest.update(file.read_bytes())
+
+    return digest.hexdigest()
+
+
+def _prune_cache(name: str) -> None:
+    """Delete all but the CACHE_ENTRIES most recently used outputs of `name`"""
+    entries = sorted(
+        config.PATHS.cache.glob(f"{name}_*.parquet"),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for path in entries[CACHE_ENTRIES:]:
+        logger.debug(f"Removing cached {path.name}")
+        path.unlink(missing_ok=True)
+
+
+def parquet_cache(
+    name: str, key: dict, build: Callable[[], pd.DataFrame]
+) -> pd.DataFrame:
+    """Return the output of `build`, stored as parquet in PATHS.cache. The output
+    is rebuilt only when no file exists yet for this `key` (a JSON-serializable
+    dictionary of everything the output depends on, including the code that
+    builds it). Only the CACHE_ENTRIES most recently used outputs of each name
+    are kept"""
+    digest = hashlib.sha256(
+        json.dumps(key, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+    path = config.PATHS.cache / f"{name}_{digest}.parquet"
+
+    if path.exists():
+        logger.debug(f"Using cached {name} ({digest})")
+        path.touch()
+        return pd.read_parquet(path)
+
+    df = build()
 
-    for k in new_dict.keys():
-        data[k] = new_dict[k]
+    config.PATHS.cache.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    df.to_parquet(tmp, index=False)
+    tmp.replace(path)
+    _prune_cache(name)
 
-    with open(path, "w") as f:
-        json.dump(data, f, indent=4)
+    return df
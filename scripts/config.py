@@ -9,10 +9,11 @@ class PATHS:
     output = project / "output"
     scripts = project / "scripts"
     logs = scripts / ".logs"
+    pages = raw_data / ".pages"
+    cache = raw_data / ".cache"
 
 
 MULTILATERALS: dict = {
-
     901: ("International Bank for Reconstruction and Development", [1]),
     905: ("International Development Association", [1]),
     906: ("Caribbean Development Bank", [x for x in range(1, 100)]),
@@ -36,8 +37,17 @@ MULTILATERALS: dict = {
 
 YEARS: dict = {"start": 2015, "end": 2020}
 
+# Memory (in bytes) that the raw data reader can use to cache files
+CACHE_MEMORY_BUDGET: int = 1_000_000_000
+
+# Socrata portal hosting the World Bank finances datasets
+SOCRATA_DOMAIN: str = "https://finances.worldbank.org"
+
 TRACKER_URL: str = (
     "https://docs.google.com/spreadsheets/d/e/"
     "2PACX-1vRcvkAHbsvjJamczcVlkx-a0D1JkQIqz3jZ84ULO0FOdxp5-"
     "N1SoYMTwGEBT1Fduc_em6dk-2ImMpam/pub?gid=0&single=true&output=csv"
-)
\ No newline at end of file
+)
+
+# Formats in which the outputs are saved (see scripts/outputs.py)
+OUTPUT_FORMATS: list = ["csv"]
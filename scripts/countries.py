@@ -0,0 +1,109 @@
+"""Country names, ISO3 codes, population and income levels.
+
+Raw country names are resolved to ISO3 codes and short names with bblocks'
+`convert_id`, once per name: the results are kept in PATHS.cache, so that
+only names that have never been seen before are matched again. Population and
+income levels come from the bblocks files in PATHS.raw_data. They are compiled
+into a table indexed by ISO3 code, which is rebuilt when those files change.
+
+Adding the data to a DataFrame is then a join on the ISO3 code."""
+
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from scripts import common, config
+from scripts.logger import logger
+
+
+def _income_levels_file() -> Path:
+    return config.PATHS.raw_data / "income_levels.csv"
+
+
+def _population_file() -> Path:
+    return config.PATHS.raw_data / "SP.POP.TOTL_all_most_recent.csv"
+
+
+def _names_file() -> Path:
+    return config.PATHS.cache / "country_names.json"
+
+
+def _read_reference() -> pd.DataFrame:
+    """Most recent population and income level of each ISO3 code"""
+    population = (
+        pd.read_csv(_population_file(), usecols=["date", "iso_code", "value"])
+        .sort_values("date")
+        .drop_duplicates("iso_code", keep="last")
+        .rename(columns={"value": "population"})
+        .filter(["iso_code", "population"])
+    )
+
+    income = pd.read_csv(_income_levels_file()).rename(
+        columns={"Code": "iso_code", "Income group": "income_level"}
+    )
+
+    return population.merge(income, on="iso_code", how="outer")
+
+
+def reference() -> pd.DataFrame:
+    """Population and income level by ISO3 code. The table is rebuilt only when
+    the population or income level files change"""
+    sources = [_income_levels_file(), _population_file()]
+    key = common.fingerprint(sources)
+
+    if key is None:
+        raise FileNotFoundError(
+            f"Missing {', '.join(p.name for p in sources if not p.exists())}. "
+            "They are downloaded by bblocks to PATHS.raw_data"
+        )
+
+    return common.parquet_cache("countries", {"sources": key}, _read_reference)
+
+
+def _read_names() -> dict:
+    if not _names_file().exists():
+        return {}
+    with open(_names_file(), "r") as f:
+        return json.load(f)
+
+
+def _write_names(names: dict) -> None:
+    path = _names_file()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(names, f, indent=4, sort_keys=True)
+    tmp.replace(path)
+
+
+def resolve(names: pd.Series) -> pd.DataFrame:
+    """Resolve raw country names to an ISO3 code and a short name. Returns a
+    DataFrame indexed by the unique raw names, with `iso_code` and `name` columns.
+    Names that cannot be matched keep the raw name and have no ISO3 code."""
+    known = _read_names()
+    new = pd.Series(names.dropna().unique()).loc[lambda s: ~s.isin(list(known))]
+
+    if len(new) > 0:
+        common.init_bblocks()
+        from bblocks.cleaning_tools.clean import convert_id
+
+        logger.debug(f"Resolving {len(new)} new country names")
+        iso_codes = convert_id(new, to_type="ISO3", not_found="")
+        short_names = convert_id(new, to_type="short_name")
+
+        for raw, iso_code, name in zip(new, iso_codes, short_names):
+            known[raw] = {"iso_code": iso_code or None, "name": name}
+        _write_names(known)
+
+    return pd.DataFrame.from_dict(known, orient="index", columns=["iso_code", "name"])
+
+
+def add_country_data(df: pd.DataFrame, id_column: str) -> pd.DataFrame:
+    """Add the short name, ISO3 code, population and income level of the
+    countries in `id_column`"""
+    index = resolve(df[id_column]).join(
+        reference().set_index("iso_code"), on="iso_code"
+    )
+
+    return df.join(index, on=id_column)
@@ -0,0 +1,129 @@
+"""Shared HTTP layer for the download scripts.
+
+All requests go through a single session that keeps connections alive and pools
+them per host. `get` remembers the ETag and Last-Modified validators of every
+response, together with its body, in PATHS.cache. Later requests for the same URL
+are conditional: when the server answers 304 Not Modified the body is not
+downloaded again and the stored copy is returned. `get_many` fetches several URLs
+concurrently."""
+
+import asyncio
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scripts import config
+from scripts.logger import logger
+
+# Connection pool settings for the shared session
+POOL_CONNECTIONS: int = 10
+POOL_MAXSIZE: int = 10
+
+TIMEOUT: int = 120
+
+_session: requests.Session | None = None
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Response:
+    """The body of a response, and whether it changed since the last request"""
+
+    content: bytes
+    modified: bool
+
+
+def session() -> requests.Session:
+    """Return the shared session, creating it on first use"""
+    global _session
+
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+
+    return _session
+
+
+def _cache_dir() -> Path:
+    return config.PATHS.cache / "http"
+
+
+def _validators_path() -> Path:
+    return _cache_dir() / "validators.json"
+
+
+def _read_validators() -> dict:
+    if not _validators_path().exists():
+        return {}
+    with open(_validators_path(), "r") as f:
+        return json.load(f)
+
+
+def _store(url: str, response: requests.Response) -> None:
+    """Save the body and validators of a response"""
+    key = hashlib.sha256(url.encode()).hexdigest()[:16]
+    body = _cache_dir() / f"{key}.body"
+
+    with _lock:
+        _cache_dir().mkdir(parents=True, exist_ok=True)
+        body.with_suffix(".tmp").write_bytes(response.content)
+        body.with_suffix(".tmp").replace(body)
+
+        validators = _read_validators()
+        validators[url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body": body.name,
+        }
+        tmp = _validators_path().with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(validators, f, indent=4)
+        tmp.replace(_validators_path())
+
+
+def get(url: str) -> Response:
+    """GET a URL, sending the validators stored from a previous response. If the
+    server replies 304 Not Modified, the stored body is returned instead."""
+    with _lock:
+        stored = _read_validators().get(url)
+
+    body = None if stored is None else _cache_dir() / stored["body"]
+
+    headers = {}
+    if body is not None and body.exists():
+        if stored["etag"]:
+            headers["If-None-Match"] = stored["etag"]
+        if stored["last_modified"]:
+            headers["If-Modified-Since"] = stored["last_modified"]
+
+    response = session().get(url, headers=headers, timeout=TIMEOUT)
+
+    if response.status_code == 304:
+        logger.debug(f"Not modified: {url}")
+        return Response(content=body.read_bytes(), modified=False)
+
+    response.raise_for_status()
+
+    if response.headers.get("ETag") or response.headers.get("Last-Modified"):
+        _store(url, response)
+
+    return Response(content=response.content, modified=True)
+
+
+async def _get_many(urls: list[str]) -> list[Response]:
+    return await asyncio.gather(*(asyncio.to_thread(get, url) for url in urls))
+
+
+def get_many(urls: list[str]) -> list[Response]:
+    """GET several URLs concurrently, returning the responses in the same order"""
+    return asyncio.run(_get_many(urls))
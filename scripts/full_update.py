@@ -1,8 +1,93 @@
+import argparse
+
+from scripts.config import PATHS
 from scripts.intel_tracker.heatmap_tracker import heatmap_data
-from scripts.world_bank_votes.download_shares import votes_chart_data
 from scripts.logger import logger
+from scripts.multilateral_spending.wb_scolly import world_bank_scrolly
+from scripts.pipeline import Stage, run
+from scripts.world_bank_finances.balance_sheet import (
+    download_financial_data,
+    tool_export_ratios,
+)
+from scripts.world_bank_finances.loans_data import sync_loan_data
+from scripts.world_bank_votes.download_shares import (
+    URLs,
+    update_votes_data,
+    votes_chart_data,
+)
+
+# Raw voting data of each institution in the votes chart
+VOTES_DATA: list = [PATHS.raw_data / f"{dataset}_data.feather" for dataset in URLs]
+
+# Only the stages that publish the heatmap and the votes chart are required: the
+# others download or build data that is not published on a schedule, and their
+# failures are logged without failing the run
+STAGES: list[Stage] = [
+    # Downloads
+    Stage(
+        name="update_votes_data",
+        func=update_votes_data,
+        outputs=VOTES_DATA,
+        kind="io",
+    ),
+    Stage(
+        name="download_financial_data",
+        func=download_financial_data,
+        outputs=[PATHS.raw_data / "IBRD_historical_balance_sheet_data.feather"],
+        kind="io",
+        required=False,
+    ),
+    Stage(
+        name="sync_loan_data",
+        func=sync_loan_data,
+        outputs=[PATHS.raw_data / "ibrd_historical_loan_cube.feather"],
+        kind="io",
+        required=False,
+    ),
+    Stage(
+        name="heatmap_data",
+        func=heatmap_data,
+        outputs=[PATHS.output / "heatmap_data.csv"],
+        kind="io",
+    ),
+    # Outputs built from the raw data
+    Stage(
+        name="votes_chart_data",
+        func=votes_chart_data,
+        inputs=VOTES_DATA,
+        outputs=[
+            PATHS.output / "wb_votes_data.csv",
+            PATHS.output / "world_bank_key_numbers.json",
+        ],
+    ),
+    Stage(
+        name="tool_export_ratios",
+        func=tool_export_ratios,
+        inputs=[PATHS.raw_data / "IBRD_historical_balance_sheet_data.feather"],
+        outputs=[PATHS.output / "tool" / "ratios.csv"],
+        required=False,
+    ),
+    Stage(
+        name="world_bank_scrolly",
+        func=world_bank_scrolly,
+        inputs=[PATHS.raw_data / "data_updates.json"],
+        outputs=[
+            PATHS.output / "wb_sector_summary.csv",
+            PATHS.output / "wb_full_summary.csv",
+        ],
+        required=False,
+    ),
+]
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the full update")
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=[stage.name for stage in STAGES],
+        help="only run these stages (by default, all of them)",
+    )
+    args = parser.parse_args()
+
     logger.info("Triggered full update")
-    heatmap_data()
-    votes_chart_data()
+    run([s for s in STAGES if args.stages is None or s.name in args.stages])
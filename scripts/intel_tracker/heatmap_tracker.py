@@ -2,9 +2,23 @@
 positions on the recommendations. It then reshapes the data into a format
 suitable for plotting a Flourish heatmap."""
 
+import io
+import time
+
 import pandas as pd
 
-from scripts import config
+from scripts import config, fetch, outputs
+from scripts.logger import logger
+from scripts.profiling import profiled
+
+# Name of the output in PATHS.output
+OUTPUT: str = "heatmap_data"
+
+# Seconds between polls of the tracker in watch mode. The interval doubles (up to
+# the maximum) every time the sheet is unchanged or the request fails, and goes
+# back to the minimum when the data changes
+MIN_INTERVAL: int = 60
+MAX_INTERVAL: int = 3_600
 
 # mapping of the recommendations used by the tracking sheet and the user-friendly names
 RECS: dict = {
@@ -17,9 +31,14 @@ RECS: dict = {
 }
 
 
+def _read_raw_data(content: bytes) -> pd.DataFrame:
+    return pd.read_csv(io.BytesIO(content), encoding="utf-8")
+
+
+@profiled
 def download_raw_data(url: str = config.TRACKER_URL) -> pd.DataFrame:
     """Download the raw data from the tracker."""
-    return pd.read_csv(url, encoding="utf-8")
+    return _read_raw_data(fetch.get(url).content)
 
 
 def _clean_columns(col: str) -> str:
@@ -27,6 +46,7 @@ def _clean_columns(col: str) -> str:
     return col.lower().strip().replace(" ", "_")
 
 
+@profiled
 def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
     """Clean the raw data from the tracker."""
     return (
@@ -36,6 +56,7 @@ def _clean_data(df: pd.DataFrame) -> pd.DataFrame:
     )
 
 
+@profiled
 def _extract_support(df: pd.DataFrame) -> pd.DataFrame:
     """Extract the support data from the tracker."""
     return df.filter(
@@ -52,12 +73,14 @@ def _extract_support(df: pd.DataFrame) -> pd.DataFrame:
     )
 
 
+@profiled
 def _reshape_support(df: pd.DataFrame) -> pd.DataFrame:
     return df.melt(id_vars="country", var_name="question", value_name="support").fillna(
         "No data"
     )
 
 
+@profiled
 def _rename_support(df: pd.DataFrame) -> pd.DataFrame:
     return df.rename(
         columns={
@@ -68,19 +91,63 @@ def _rename_support(df: pd.DataFrame) -> pd.DataFrame:
     ).replace(RECS, regex=False)
 
 
-def heatmap_data() -> None:
-    """Extract the support data from the tracker and reshape it for plotting."""
-
-    # Get the data nd run it through the pipeline
-    data = (
-        download_raw_data()
-        .pipe(_clean_data)
+def _reshape(raw: pd.DataFrame) -> pd.DataFrame:
+    """Run the raw tracker data through the pipeline"""
+    return (
+        raw.pipe(_clean_data)
         .pipe(_extract_support)
         .pipe(_reshape_support)
         .pipe(_rename_support)
     )
 
-    data.to_csv(config.PATHS.output / "heatmap_data.csv", index=False)
+
+@profiled
+def heatmap_data() -> None:
+    """Extract the support data from the tracker and reshape it for plotting."""
+
+    if outputs.export(_reshape(download_raw_data()), OUTPUT):
+        logger.info("Updated heatmap data")
+    else:
+        logger.info("Heatmap data unchanged")
+
+
+def watch(
+    url: str = config.TRACKER_URL,
+    min_interval: int = MIN_INTERVAL,
+    max_interval: int = MAX_INTERVAL,
+    polls: int | None = None,
+) -> None:
+    """Poll the tracker and publish the heatmap data whenever it changes.
+
+    Runs until interrupted, or for a number of `polls`. Requests are conditional,
+    so an unchanged sheet is neither downloaded nor reshaped again. Failed
+    requests are logged and retried after a longer interval."""
+    interval = min_interval
+    poll = 0
+    exported = False
+
+    while polls is None or poll < polls:
+        poll += 1
+        try:
+            response = fetch.get(url)
+            changed = False
+            if response.modified or not exported:
+                data = _reshape(_read_raw_data(response.content))
+                changed = bool(outputs.export(data, OUTPUT))
+                exported = True
+        except Exception as e:
+            logger.error(f"Tracker update failed: {e!r}")
+            changed = False
+
+        if changed:
+            logger.info("Updated heatmap data")
+            interval = min_interval
+        else:
+            interval = min(interval * 2, max_interval)
+
+        if polls is None or poll < polls:
+            logger.debug(f"Next tracker poll in {interval}s")
+            time.sleep(interval)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+"""Lookup tables used to label CRS codes (sectors, flows and regions).
+
+Each mapping is compiled once into a dense NumPy array indexed by code, which
+holds the position of each label in a list of categories. Labelling a column of
+codes is then a single array indexing operation that returns a categorical.
+Compiled tables are kept in memory and saved in PATHS.cache, so the CRS codes
+are only read again when the data or this module changes."""
+
+import hashlib
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from scripts import common, config
+
+
+def _sector_codes() -> dict:
+    common.init_oda_data()
+    from oda_data.tools.names import read_crs_codes
+
+    d = read_crs_codes()["sector_code"]
+
+    return {int(k): v["name"] for k, v in d.items()}
+
+
+def _flow_codes() -> dict:
+    return {
+        11: "ODA Grants",
+        14: "Other Loans",
+        13: "ODA Loans",
+        19: "Equity Investment",
+    }
+
+
+def _region_codes() -> dict:
+    return {
+        10003: "Africa",
+        10006: "South America",
+        15006: "Regional and Unspecified",
+        10009: "South & Central Asia",
+        10010: "Europe",
+        10012: "Oceania",
+        10007: "Asia",
+        10011: "Middle East",
+        10008: "Far East Asia",
+        10005: "Caribbean & Central America",
+        10002: "Africa",
+        10004: "America",
+        10001: "Africa",
+        298: "Africa",
+        798: "Asia",
+    }
+
+
+def _sector_groups():
+    d = {
+        "Education": list(range(110, 120)),
+        "Health": list(range(120, 140)),
+        "Water and Sanitation": list(range(140, 150)),
+        "Government and Civil Society": list(range(150, 160)),
+        "Other Social Infrastructure": list(range(160, 170)),
+        "Transport & Storage": list(range(210, 220)),
+        "Communications": list(range(220, 230)),
+        "Energy": list(range(230, 240)),
+        "Banking and Financial Services": list(range(240, 250)),
+        "Business & Other Services": list(range(250, 260)),
+        "Agriculture, Forestry and Fishing": list(range(310, 320)),
+        "Industry, Mining and Construction": list(range(320, 330)),
+        "Trade Policy and Regulations": list(range(330, 340)),
+        "General Environmental Protection": list(range(410, 430)),
+        "Other Multisector": list(range(430, 440)),
+        "General Budget Support": list(range(510, 520)),
+        "Development Food Assistance": list(range(520, 530)),
+        "Other commodity assistance": list(range(530, 540)),
+        "Action Relating to Debt": list(range(600, 700)),
+        "Emergency Response": list(range(700, 800)),
+        "Administrative Costs of Donors": list(range(910, 930)),
+        "Refugees in Donor Countries": list(range(930, 940)),
+        "Unallocated/Unspecified": list(range(998, 1000)),
+    }
+
+    summary_dict = {}
+
+    for sector, values in d.items():
+        summary_dict.update({val: sector for val in values})
+
+    return summary_dict
+
+
+# Functions that return each mapping of codes to labels
+TABLES: dict = {
+    "sector_name": _sector_codes,
+    "sector_group": _sector_groups,
+    "flow_name": _flow_codes,
+    "region_name": _region_codes,
+}
+
+
+def _compile(mapping: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Compile a mapping of codes to labels into a lookup array and categories.
+    Categories are sorted, so that grouping by them keeps the order of the labels.
+    Codes without a label point to -1."""
+    categories = np.unique(np.array(list(mapping.values()), dtype="str"))
+    positions = {category: i for i, category in enumerate(categories)}
+
+    lookup = np.full(max(mapping) + 1, -1, dtype="int32")
+    lookup[list(mapping)] = [positions[label] for label in mapping.values()]
+
+    return lookup, categories
+
+
+def _cache_path(table: str) -> Path:
+    """Return where a compiled table is saved. The name changes with the OECD
+    data vintage and with the contents of this module."""
+    digest = hashlib.sha256(
+        Path(__file__).read_bytes() + str(common.data_vintage("oecd_dac_data")).encode()
+    ).hexdigest()[:16]
+
+    return config.PATHS.cache / f"code_table_{table}_{digest}.npz"
+
+
+@cache
+def compiled(table: str) -> tuple[np.ndarray, np.ndarray]:
+    """Return the lookup array and categories of a table, compiling it if it
+    isn't saved yet"""
+    path = _cache_path(table)
+
+    if path.exists():
+        with np.load(path) as saved:
+            return saved["lookup"], saved["categories"]
+
+    lookup, categories = _compile(TABLES[table]())
+
+    config.PATHS.cache.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".tmp"), "wb") as f:
+        np.savez(f, lookup=lookup, categories=categories)
+    path.with_suffix(".tmp").replace(path)
+
+    return lookup, categories
+
+
+def label(codes: pd.Series, table: str) -> pd.Series:
+    """Label a column of codes using one of the TABLES, as a categorical column.
+    Missing codes and codes without a label become NaN."""
+    lookup, categories = compiled(table)
+
+    values = codes.to_numpy(dtype="int64", na_value=-1)
+    known = (values >= 0) & (values < len(lookup))
+    positions = np.where(known, lookup[np.where(known, values, 0)], -1)
+
+    return pd.Series(
+        pd.Categorical.from_codes(positions, categories=categories),
+        index=codes.index,
+        name=codes.name,
+    )
@@ -1,89 +1,43 @@
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-from oda_data import set_data_path, ODAData
-from oda_data.tools.names import add_name, read_crs_codes
 
-from scripts import config
+from scripts import common, config
 from scripts.config import YEARS
-
-set_data_path(config.PATHS.raw_data)
-
-
-def _sector_codes() -> dict:
-    d = read_crs_codes()["sector_code"]
-
-    return {int(k): v["name"] for k, v in d.items()}
+from scripts.multilateral_spending import code_tables
+from scripts.profiling import profiled
 
 
-def _flow_codes() -> dict:
-    return {
-        11: "ODA Grants",
-        14: "Other Loans",
-        13: "ODA Loans",
-        19: "Equity Investment",
-    }
-
+def _pack_codes(donor_code, agency_code):
+    """Pack donor and agency codes into a single integer key."""
+    return (donor_code << 32) | agency_code
 
-def _region_codes() -> dict:
-    return {
-        10003: "Africa",
-        10006: "South America",
-        15006: "Regional and Unspecified",
-        10009: "South & Central Asia",
-        10010: "Europe",
-        10012: "Oceania",
-        10007: "Asia",
-        10011: "Middle East",
-        10008: "Far East Asia",
-        10005: "Caribbean & Central America",
-        10002: "Africa",
-        10004: "America",
-        10001: "Africa",
-        298: "Africa",
-        798: "Asia",
-    }
 
+def _donor_agency_keys(donors_dict: dict[str, tuple[str, list[int]]]) -> np.ndarray:
+    """Return the sorted (donor, agency) keys of the multilateral donors."""
+    return np.unique(
+        [
+            _pack_codes(int(bank), agency)
+            for bank, (name, codes) in donors_dict.items()
+            for agency in codes
+        ]
+    ).astype("int64")
 
-def _sector_groups():
-    d = {
-        "Education": list(range(110, 120)),
-        "Health": list(range(120, 140)),
-        "Water and Sanitation": list(range(140, 150)),
-        "Government and Civil Society": list(range(150, 160)),
-        "Other Social Infrastructure": list(range(160, 170)),
-        "Transport & Storage": list(range(210, 220)),
-        "Communications": list(range(220, 230)),
-        "Energy": list(range(230, 240)),
-        "Banking and Financial Services": list(range(240, 250)),
-        "Business & Other Services": list(range(250, 260)),
-        "Agriculture, Forestry and Fishing": list(range(310, 320)),
-        "Industry, Mining and Construction": list(range(320, 330)),
-        "Trade Policy and Regulations": list(range(330, 340)),
-        "General Environmental Protection": list(range(410, 430)),
-        "Other Multisector": list(range(430, 440)),
-        "General Budget Support": list(range(510, 520)),
-        "Development Food Assistance": list(range(520, 530)),
-        "Other commodity assistance": list(range(530, 540)),
-        "Action Relating to Debt": list(range(600, 700)),
-        "Emergency Response": list(range(700, 800)),
-        "Administrative Costs of Donors": list(range(910, 930)),
-        "Refugees in Donor Countries": list(range(930, 940)),
-        "Unallocated/Unspecified": list(range(998, 1000)),
-    }
-
-    summary_dict = {}
-
-    for sector, values in d.items():
-        summary_dict.update({val: sector for val in values})
-
-    return summary_dict
 
+@profiled
+def _filter_donor_agencies(data: pd.DataFrame, keys: np.ndarray) -> pd.DataFrame:
+    """Return a DataFrame with only the (donor, agency) pairs in `keys`."""
+    packed = _pack_codes(
+        data.donor_code.to_numpy(dtype="int64", na_value=-1),
+        data.agency_code.to_numpy(dtype="int64", na_value=-1),
+    )
+    if len(keys) == 0:
+        return data.iloc[0:0]
 
-def _multi_donor_query(donors_dict: dict[str, tuple[str, list[int]]]) -> str:
-    """Return a query string to filter a DataFrame for multilateral donors."""
-    query = ""
-    for bank, (name, codes) in donors_dict.items():
-        query += f"(donor_code == {bank} & agency_code.isin({codes})) | "
-    return query[:-3]
+    # keys are sorted, so membership is a binary search over them
+    position = np.searchsorted(keys, packed).clip(max=len(keys) - 1)
+    return data.loc[keys[position] == packed]
 
 
 def _summarise_data(data: pd.DataFrame) -> pd.DataFrame:
@@ -113,26 +67,45 @@ def _summarise_data(data: pd.DataFrame) -> pd.DataFrame:
 def _add_names(
     data: pd.DataFrame, donors_dict: dict[str, tuple[str, list[int]]]
 ) -> pd.DataFrame:
+    common.init_oda_data()
+    from oda_data.tools.names import add_name
+
     return (
         data.assign(donor_name=lambda d: d.donor_code.map(donors_dict).str[0])
     ).pipe(add_name, "recipient_code")
 
 
+# Columns by which the MDB data is summarised
+SECTOR_GROUP: list = [
+    "year",
+    "donor_name",
+    "region_name",
+    "recipient_name",
+    "flow_name",
+    "sector_name",
+    "prices",
+    "currency",
+]
+
+
+@profiled
 def _summarise_sectors(data: pd.DataFrame) -> pd.DataFrame:
-    group = [
-        "year",
-        "donor_name",
-        "region_name",
-        "recipient_name",
-        "flow_name",
-        "sector_name",
-        "prices",
-        "currency",
-    ]
+    data = data.assign(
+        sector_name=lambda d: code_tables.label(d.sector_code, "sector_group")
+    )
+
+    return data.groupby(SECTOR_GROUP, observed=True)["value"].sum().reset_index()
 
-    data = data.assign(sector_name=lambda d: d.sector_code.map(_sector_groups()))
 
-    return data.groupby(group, observed=True)["value"].sum().reset_index()
+@profiled
+def _merge_summaries(summaries: list[pd.DataFrame]) -> pd.DataFrame:
+    """Combine partial outputs of _summarise_sectors into a single summary."""
+    return (
+        pd.concat(summaries, ignore_index=True)
+        .groupby(SECTOR_GROUP, observed=True)["value"]
+        .sum()
+        .reset_index()
+    )
 
 
 def _keep_disbursements_only(data: pd.DataFrame) -> pd.DataFrame:
@@ -156,13 +129,11 @@ def _simplify_africa(data: pd.DataFrame) -> pd.DataFrame:
     )
 
 
-def full_mdb_data(donors_dict: dict[str, tuple[str, list[int]]] = None) -> pd.DataFrame:
-    """Return a DataFrame of MDB data."""
-    if donors_dict is None:
-        donors_dict = config.MULTILATERALS
-
-    years = range(YEARS["start"], YEARS["end"] + 1)
-
+@profiled
+def _mdb_data(
+    years: list[int] | range, donors_dict: dict[str, tuple[str, list[int]]]
+) -> pd.DataFrame:
+    """Return the MDB data for the given years, summarised by sector."""
     columns = [
         "year",
         "indicator",
@@ -176,6 +147,9 @@ def full_mdb_data(donors_dict: dict[str, tuple[str, list[int]]] = None) -> pd.Da
         "prices",
     ]
 
+    common.init_oda_data()
+    from oda_data import ODAData
+
     oda = (
         ODAData(years=years, donors=list(donors_dict))
         .load_indicator("crs_bilateral_all_flows_disbursement_gross")
@@ -183,7 +157,72 @@ def full_mdb_data(donors_dict: dict[str, tuple[str, list[int]]] = None) -> pd.Da
         .add_names()
     )
 
-    query = _multi_donor_query(donors_dict)
+    return _process_crs(oda.get_data(), donors_dict)
+
+
+@profiled
+def _process_crs(
+    data: pd.DataFrame, donors_dict: dict[str, tuple[str, list[int]]]
+) -> pd.DataFrame:
+    """Filter CRS data to the MDB donors and agencies, label it and summarise it
+    by sector."""
+    keys = _donor_agency_keys(donors_dict)
+
+    return (
+        data.loc[lambda d: d.value > 0]
+        .pipe(_filter_donor_agencies, keys)
+        .assign(
+            flow_name=lambda d: code_tables.label(d.flow_code, "flow_name"),
+            donor_name=lambda d: d.donor_code.map(donors_dict).str[0],
+            region_name=lambda d: code_tables.label(d.region_code, "region_name"),
+        )
+        .pipe(_summarise_sectors)
+    )
+
+
+@profiled
+def full_mdb_data(
+    donors_dict: dict[str, tuple[str, list[int]]] = None,
+    streaming: bool = False,
+    years: list[int] | int | None = None,
+) -> pd.DataFrame:
+    """Return a DataFrame of MDB data.
+
+    Only the donors in `donors_dict` and the `years` requested (by default, all
+    the years in config.YEARS) are loaded from the CRS.
+
+    With `streaming`, the CRS data is loaded and summarised one year at a time
+    and the partial summaries are merged, so only one year of the full CRS is
+    in memory at any point.
+
+    Outputs are cached as parquet, keyed on the donors, the years, the date
+    of the OECD data recorded in raw_data/data_updates.json and the source of
+    this module and of code_tables, so that changes to the processing code
+    don't serve stale outputs."""
+    if donors_dict is None:
+        donors_dict = config.MULTILATERALS
+
+    if years is None:
+        years = range(YEARS["start"], YEARS["end"] + 1)
+
+    if isinstance(years, int):
+        years = [years]
+
+    key = {
+        "donors": {str(k): v for k, v in donors_dict.items()},
+        "years": sorted(years),
+        "vintage": common.data_vintage("oecd_dac_data"),
+        "code": common.fingerprint([Path(__file__), Path(code_tables.__file__)]),
+    }
+
+    return common.parquet_cache(
+        "mdb_data", key, lambda: _full_mdb_data(donors_dict, list(years), streaming)
+    )
+
+
+def _full_mdb_data(
+    donors_dict: dict[str, tuple[str, list[int]]], years: list[int], streaming: bool
+) -> pd.DataFrame:
 
     output = [
         "year",
@@ -197,16 +236,9 @@ def full_mdb_data(donors_dict: dict[str, tuple[str, list[int]]] = None) -> pd.Da
         "value",
     ]
 
-    return (
-        oda.get_data()
-        .loc[lambda d: d.value > 0]
-        .query(query)
-        .assign(
-            flow_name=lambda d: d.flow_code.map(_flow_codes()),
-            donor_name=lambda d: d.donor_code.map(donors_dict).str[0],
-            region_name=lambda d: d.region_code.map(_region_codes()),
-        )
-        .pipe(_summarise_sectors)
-        .filter(output, axis=1)
-        .reset_index(drop=True)
-    )
+    if streaming:
+        data = _merge_summaries([_mdb_data([year], donors_dict) for year in years])
+    else:
+        data = _mdb_data(years, donors_dict)
+
+    return data.filter(output, axis=1).reset_index(drop=True)
@@ -1,6 +1,8 @@
 """This script contains functions to generate the data for the World Bank scrollytelling story."""
-from scripts import config
+
+from scripts import config, outputs
 from scripts.multilateral_spending.spending_data import full_mdb_data
+from scripts.profiling import profiled
 import pandas as pd
 
 
@@ -28,6 +30,7 @@ def _add_share_column(data: pd.DataFrame, group_by: list) -> pd.DataFrame:
     return data.reset_index(drop=False)
 
 
+@profiled
 def _overall_wb_data(years: int = 2020) -> pd.DataFrame:
     """Produce a version of the dataset for the World Bank Group"""
     if isinstance(years, int):
@@ -49,12 +52,14 @@ def _overall_wb_data(years: int = 2020) -> pd.DataFrame:
         "sector_name",
     ]
 
+    donors = {k: v for k, v in config.MULTILATERALS.items() if v[0] in world_bank}
+
     return (
-        full_mdb_data()
+        full_mdb_data(donors_dict=donors, years=years)
         .pipe(_filter_donors, world_bank)
-        .pipe(_filter_years, 2020)
+        .pipe(_filter_years, years)
         .assign(donor="World Bank Group")
-        .groupby(grouper)
+        .groupby(grouper, observed=True)
         .sum(numeric_only=True)
         .reset_index(drop=False)
     )
@@ -65,7 +70,7 @@ def __df_summary(df: pd.DataFrame, grouper: list[str]) -> pd.DataFrame:
     function assumes only 1 year is included"""
 
     return (
-        df.groupby(grouper)
+        df.groupby(grouper, observed=True)
         .sum(numeric_only=True)
         .round(2)
         .drop(columns=["year"])
@@ -73,6 +78,7 @@ def __df_summary(df: pd.DataFrame, grouper: list[str]) -> pd.DataFrame:
     )
 
 
+@profiled
 def _flow_region_recipient_summary(df: pd.DataFrame) -> pd.DataFrame:
     """Takes the full dataset and produces a summary by flow, region and recipient
     This script assumes only 1 year of data is passed to it."""
@@ -82,6 +88,7 @@ def _flow_region_recipient_summary(df: pd.DataFrame) -> pd.DataFrame:
     return __df_summary(df, grouper)
 
 
+@profiled
 def _sector_summary(df: pd.DataFrame) -> pd.DataFrame:
     """Takes the full dataset and produces a summary by sector
     This script assumes only 1 year of data is passed to it."""
@@ -91,6 +98,7 @@ def _sector_summary(df: pd.DataFrame) -> pd.DataFrame:
     return __df_summary(df, grouper)
 
 
+@profiled
 def world_bank_scrolly() -> None:
     """Produce the data for the World Bank scrollytelling story."""
 
@@ -104,5 +112,6 @@ def world_bank_scrolly() -> None:
     full_summary = _flow_region_recipient_summary(overall_data)
 
     # save files
-    sector_summary.to_csv(config.PATHS.output / "wb_sector_summary.csv", index=False)
-    full_summary.to_csv(config.PATHS.output / "wb_full_summary.csv", index=False)
+    outputs.export_many(
+        {"wb_sector_summary": sector_summary, "wb_full_summary": full_summary}
+    )
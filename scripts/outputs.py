@@ -0,0 +1,118 @@
+"""Write the outputs of the scripts to PATHS.output.
+
+An output is saved in each of the formats in config.OUTPUT_FORMATS, side by
+side (e.g. wb_votes_data.csv and wb_votes_data.parquet). Each file is first
+encoded in memory. It is only written if its content differs from the file
+on disk, and it replaces that file with an atomic rename, so readers never see
+a partial file. Several outputs are written concurrently by `export_many`.
+
+New formats can be added to WRITERS."""
+
+import gzip
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from scripts import config
+from scripts.logger import logger
+
+MAX_WORKERS: int = 4
+
+
+def _csv(data: pd.DataFrame) -> bytes:
+    return data.to_csv(index=False).encode("utf-8")
+
+
+def _csv_gz(data: pd.DataFrame) -> bytes:
+    # mtime=0 so that the same data always gives the same bytes
+    return gzip.compress(_csv(data), mtime=0)
+
+
+def _parquet(data: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    data.to_parquet(buffer, index=False, compression="zstd")
+    return buffer.getvalue()
+
+
+def _arrow(data: pd.DataFrame) -> bytes:
+    sink = pa.BufferOutputStream()
+    feather.write_feather(
+        pa.Table.from_pandas(data, preserve_index=False), sink, compression="lz4"
+    )
+    return sink.getvalue().to_pybytes()
+
+
+# file extension -> function encoding a DataFrame in that format
+WRITERS: dict[str, Callable[[pd.DataFrame], bytes]] = {
+    "csv": _csv,
+    "csv.gz": _csv_gz,
+    "parquet": _parquet,
+    "arrow": _arrow,
+}
+
+
+def _digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def write(content: bytes, path: Path) -> bool:
+    """Write `content` to `path`, unless the file already has the same content.
+    Returns whether the file changed"""
+    if path.exists() and _digest(path.read_bytes()) == _digest(content):
+        logger.debug(f"Unchanged {path.name}")
+        return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    tmp.write_bytes(content)
+    tmp.replace(path)
+
+    return True
+
+
+def _export(
+    writer: Callable[[pd.DataFrame], bytes], data: pd.DataFrame, path: Path
+) -> bool:
+    return write(writer(data), path)
+
+
+def _paths(name: str, formats: list[str] | None) -> dict[str, Path]:
+    formats = config.OUTPUT_FORMATS if formats is None else formats
+
+    unknown = set(formats) - set(WRITERS)
+    if unknown:
+        raise ValueError(f"Unsupported output formats: {sorted(unknown)}")
+
+    return {f: config.PATHS.output / f"{name}.{f}" for f in formats}
+
+
+def export(
+    data: pd.DataFrame, name: str, formats: list[str] | None = None
+) -> list[Path]:
+    """Save `data` as PATHS.output/`name`.<format> for each format. `name` can
+    include subfolders (e.g. "tool/ratios"). Returns the files that changed"""
+    return export_many({name: data}, formats=formats)
+
+
+def export_many(
+    outputs: dict[str, pd.DataFrame],
+    formats: list[str] | None = None,
+    max_workers: int = MAX_WORKERS,
+) -> list[Path]:
+    """Save several outputs (a dictionary of name: data) on a pool of threads.
+    Returns the files that changed"""
+    jobs = [
+        (WRITERS[f], data, path)
+        for name, data in outputs.items()
+        for f, path in _paths(name, formats).items()
+    ]
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        futures = [pool.submit(_export, *job) for job in jobs]
+        return [path for (_, _, path), f in zip(jobs, futures) if f.result()]
@@ -0,0 +1,149 @@
+"""A small task-graph runner for the update scripts.
+
+Each stage declares the files it reads and writes. A stage depends on the stages
+that write its inputs, and runs as soon as they have finished. Network-bound
+stages run on a thread pool and CPU-bound stages on a process pool.
+
+Like make, a stage is skipped when its outputs exist and its inputs have the
+same content as the last time it ran. Stages without inputs (downloads) always
+run."""
+
+import json
+import multiprocessing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from scripts import common, config
+from scripts.logger import logger
+
+# Where the input fingerprints of the last successful run of each stage are kept
+STATE_FILE: Path = config.PATHS.cache / "pipeline_state.json"
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A step of the pipeline. `func` must be importable at module level so that
+    it can be sent to a worker process. `kind` is "io" for network-bound stages
+    and "cpu" for the rest. If a stage that is not `required` fails, the failure
+    is logged but the run doesn't fail."""
+
+    name: str
+    func: Callable[[], None]
+    inputs: list[Path] = field(default_factory=list)
+    outputs: list[Path] = field(default_factory=list)
+    kind: str = "cpu"
+    required: bool = True
+
+
+def _dependencies(stages: list[Stage]) -> dict[str, set[str]]:
+    """Map each stage to the stages that write any of its inputs"""
+    writers = {Path(o): s.name for s in stages for o in s.outputs}
+
+    return {
+        s.name: {writers[Path(i)] for i in s.inputs if Path(i) in writers} - {s.name}
+        for s in stages
+    }
+
+
+def _read_state() -> dict:
+    if not STATE_FILE.exists():
+        return {}
+    with open(STATE_FILE, "r") as f:
+        return json.load(f)
+
+
+def _write_state(state: dict) -> None:
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=4)
+    tmp.replace(STATE_FILE)
+
+
+def _up_to_date(stage: Stage, inputs: str | None, state: dict) -> bool:
+    if not stage.inputs or not all(Path(o).exists() for o in stage.outputs):
+        return False
+    return inputs is not None and state.get(stage.name) == inputs
+
+
+def run(
+    stages: list[Stage],
+    force: bool = False,
+    io_workers: int = 4,
+    cpu_workers: int | None = None,
+) -> None:
+    """Run the stages in dependency order, in parallel where possible. With
+    `force`, stages run even if their inputs haven't changed. Raises a
+    RuntimeError if any required stage fails or is skipped because a stage it
+    depends on failed."""
+    dependencies = _dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    state = _read_state()
+
+    pending = set(by_name)
+    done, failed = set(), set()
+    running: dict[Future, str] = {}
+    inputs: dict[str, str | None] = {}
+
+    # Workers are spawned rather than forked: forking while the io threads hold
+    # locks (in requests or scripts.fetch) could leave them locked in the child
+    with ThreadPoolExecutor(io_workers) as io_pool, ProcessPoolExecutor(
+        cpu_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as cpu_pool:
+        while pending or running:
+            # Stages that depend on a failed stage cannot run
+            for name in [n for n in pending if dependencies[n] & failed]:
+                logger.error(f"Skipped {name}: a stage it depends on failed")
+                pending.remove(name)
+                failed.add(name)
+
+            ready = [n for n in pending if dependencies[n] <= done]
+
+            for name in ready:
+                stage = by_name[name]
+                pending.remove(name)
+                inputs[name] = common.fingerprint(stage.inputs)
+
+                if not force and _up_to_date(stage, inputs[name], state):
+                    logger.debug(f"Skipped {name}: inputs unchanged")
+                    done.add(name)
+                    continue
+
+                logger.debug(f"Started {name}")
+                pool = io_pool if stage.kind == "io" else cpu_pool
+                running[pool.submit(stage.func)] = name
+
+            if not running:
+                if pending and not ready:
+                    raise ValueError(f"Circular dependencies between {pending}")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Failed {name}: {e!r}")
+                    failed.add(name)
+                    continue
+
+                logger.debug(f"Finished {name}")
+                done.add(name)
+                if inputs[name] is not None:
+                    state[name] = inputs[name]
+                    _write_state(state)
+
+    if failed - {n for n in failed if not by_name[n].required}:
+        raise RuntimeError(f"Pipeline stages failed: {sorted(failed)}")
+    if failed:
+        logger.warning(f"Optional stages failed: {sorted(failed)}")
@@ -0,0 +1,148 @@
+"""Opt-in profiling of the steps of the data pipelines.
+
+Functions decorated with `profiled` record, for every call, the wall time, the
+peak memory allocated while they ran (with tracemalloc) and the number of rows
+and bytes of the DataFrames they receive and return. Each record is logged as
+JSON through scripts.logger, and the time spent in each stack of profiled calls
+is appended to PATHS.logs/profile.folded, in the folded format read by flame
+graph tools.
+
+tracemalloc only tracks the peak of the whole process. When profiled calls run
+at the same time on several threads (as the pipeline's download stages do),
+their peaks can't be told apart, so the records of calls that overlapped with
+a profiled call on another thread have no peak_memory.
+
+Profiling is enabled by setting the SCRIPTS_PROFILE environment variable to 1
+before the scripts are imported. Otherwise `profiled` returns the functions
+unchanged, so it adds no overhead."""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+from scripts import config
+from scripts.logger import logger
+
+ENABLED: bool = os.environ.get("SCRIPTS_PROFILE") == "1"
+
+FOLDED_FILE = config.PATHS.logs / "profile.folded"
+
+_local = threading.local()
+_lock = threading.Lock()
+
+# Stack of profiled calls running on each thread, by thread id
+_stacks: dict[int, list[dict]] = {}
+
+
+def _frame_stats(obj) -> dict:
+    """Rows and bytes of a DataFrame or Series, if `obj` is one"""
+    if isinstance(obj, pd.DataFrame):
+        return {"rows": len(obj), "bytes": int(obj.memory_usage(deep=True).sum())}
+    if isinstance(obj, pd.Series):
+        return {"rows": len(obj), "bytes": int(obj.memory_usage(deep=True))}
+    return {}
+
+
+def _stack() -> list[dict]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+        with _lock:
+            _stacks[threading.get_ident()] = _local.stack
+    return _local.stack
+
+
+def _mark_overlaps(stack: list[dict]) -> None:
+    """If profiled calls are running on other threads, mark them and the calls
+    on this thread's `stack` as overlapping"""
+    with _lock:
+        others = [
+            entry
+            for thread, entries in _stacks.items()
+            if thread != threading.get_ident()
+            for entry in entries
+        ]
+        if others:
+            for entry in others + stack:
+                entry["overlapped"] = True
+
+
+def _write_folded(frames: list[tuple[str, float]]) -> None:
+    """Append the self time (in microseconds) of each stack to the folded file"""
+    with _lock, open(FOLDED_FILE, "a") as f:
+        for stack, seconds in frames:
+            f.write(f"{stack} {max(int(seconds * 1e6), 0)}\n")
+
+
+def profiled(func):
+    """Record time, memory and data sizes of each call to `func`, if profiling is
+    enabled. Nested profiled calls are recorded as part of their caller's stack."""
+    if not ENABLED:
+        return func
+
+    name = f"{func.__module__.split('.')[-1]}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        stack = _stack()
+        parent = stack[-1] if stack else None
+
+        frame_in = next((a for a in args if isinstance(a, pd.DataFrame)), None)
+        stats_in = _frame_stats(frame_in)
+
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent["peak"] = max(parent["peak"], peak)
+        tracemalloc.reset_peak()
+
+        path = f"{parent['path']};{name}" if parent else name
+        entry = {
+            "path": path,
+            "peak": 0,
+            "children": 0.0,
+            "folded": [],
+            "overlapped": False,
+        }
+        stack.append(entry)
+        _mark_overlaps(stack)
+
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(entry["peak"], peak)
+        entry["folded"].append((path, elapsed - entry["children"]))
+
+        if parent is not None:
+            parent["peak"] = max(parent["peak"], peak)
+            parent["children"] += elapsed
+            parent["folded"].extend(entry["folded"])
+        else:
+            _write_folded(entry["folded"])
+
+        stats_out = _frame_stats(result)
+        record = {
+            "stage": path,
+            "seconds": round(elapsed, 6),
+            "peak_memory": None if entry["overlapped"] else peak - current,
+            "rows_in": stats_in.get("rows"),
+            "bytes_in": stats_in.get("bytes"),
+            "rows_out": stats_out.get("rows"),
+            "bytes_out": stats_out.get("bytes"),
+        }
+        logger.debug(f"profile {json.dumps(record)}")
+
+        return result
+
+    return wrapper
@@ -0,0 +1,177 @@
+"""Shared, memoized reader for the files stored in raw_data.
+
+Several pipelines read the same feather files more than once per run. Files read
+through `read_cached` are deserialized once per process and kept in memory until
+they change on disk or are evicted to stay within config.CACHE_MEMORY_BUDGET.
+The data of cached frames is made read-only, and callers get a shallow copy: they
+can add, replace or drop columns, but modifying values in place raises an error
+instead of changing the cache. Nothing is copied.
+
+`scan` reads only some of the columns and rows of a feather file or of a
+partitioned parquet dataset, applying the filters through pyarrow while reading.
+Partitions that cannot match the filters are skipped."""
+
+import operator
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from scripts import config
+
+# Comparison operators accepted in `scan` filters
+_OPERATORS: dict = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+# (path, mtime, loader, arguments) -> (DataFrame, size in bytes), in order of use
+_cache: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+
+def _freeze(df: pd.DataFrame) -> pd.DataFrame:
+    """Make the arrays holding the data of a frame read-only, so that setting
+    values in place raises a ValueError"""
+    for values in df._mgr.arrays:
+        # categoricals and datetimes keep their data in a NumPy array too
+        array = getattr(values, "_ndarray", values)
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+    return df
+
+
+def _frame_size(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _evict(budget: int) -> None:
+    """Drop the least recently used frames until the cache fits the budget"""
+    while _cache and sum(size for _, size in _cache.values()) > budget:
+        _cache.popitem(last=False)
+
+
+def modified(path: Path) -> int:
+    """Return the modification time of a file, or the latest one of a folder"""
+    if not path.is_dir():
+        return path.stat().st_mtime_ns
+    return max(p.stat().st_mtime_ns for p in [path, *path.rglob("*")])
+
+
+def _drop_stale(path: Path, mtime: int) -> None:
+    """Drop frames read from a previous version of a file"""
+    for cache_key in [k for k in _cache if k[0] == path and k[1] != mtime]:
+        del _cache[cache_key]
+
+
+def _hashable(value):
+    """Turn lists (possibly nested) into tuples so they can be part of a key"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def read_cached(
+    path: str | Path,
+    loader: Callable[..., pd.DataFrame] = pd.read_feather,
+    **kwargs,
+) -> pd.DataFrame:
+    """Read a file through `loader`, reusing the result of previous calls. The
+    frame returned shares its (read-only) data with the cache.
+
+    Entries are keyed by the path and modification time of the file, the loader
+    and any keyword arguments passed on to the loader. The loader should be a
+    module level function so that it is the same object across calls."""
+    path = Path(path).resolve()
+    mtime = modified(path)
+    arguments = tuple(sorted((k, _hashable(v)) for k, v in kwargs.items()))
+    cache_key = (path, mtime, loader, arguments)
+
+    with _lock:
+        if cache_key in _cache:
+            _cache.move_to_end(cache_key)
+            return _cache[cache_key][0].copy(deep=False)
+
+    df = _freeze(loader(path, **kwargs))
+    size = _frame_size(df)
+
+    with _lock:
+        _drop_stale(path, mtime)
+        if size <= config.CACHE_MEMORY_BUDGET:
+            _cache[cache_key] = (df, size)
+            _evict(config.CACHE_MEMORY_BUDGET)
+
+    return df.copy(deep=False)
+
+
+def clear_cache() -> None:
+    """Remove all frames from the cache"""
+    with _lock:
+        _cache.clear()
+
+
+def _value_set(values: list, field_type: pa.DataType) -> pa.Array:
+    """Convert filter values to the type of the column they are compared with"""
+    if pa.types.is_temporal(field_type):
+        return pa.array(pd.to_datetime(list(values))).cast(field_type)
+    if pa.types.is_dictionary(field_type):
+        field_type = field_type.value_type
+    return pa.array(list(values)).cast(field_type)
+
+
+def _filter_expression(
+    filters: list[tuple[str, str, object]], schema: pa.Schema
+) -> ds.Expression | None:
+    """Build a pyarrow expression from a list of (column, operator, value) tuples,
+    which are combined with AND. Supported operators are `in`, `not in` and the
+    usual comparisons. As in pandas, `not in` keeps missing values."""
+    expression = None
+
+    for column, op, value in filters:
+        field = pc.field(column)
+        field_type = schema.field(column).type
+
+        if op == "in":
+            condition = field.isin(_value_set(value, field_type))
+        elif op == "not in":
+            condition = ~field.isin(_value_set(value, field_type)) | field.is_null()
+        elif op in _OPERATORS:
+            condition = _OPERATORS[op](field, _value_set([value], field_type)[0])
+        else:
+            raise ValueError(f"Unsupported filter operator: {op}")
+
+        expression = condition if expression is None else expression & condition
+
+    return expression
+
+
+def scan(
+    path: str | Path,
+    columns: list[str] | None = None,
+    filters: list[tuple[str, str, object]] | None = None,
+    partitioning: ds.Partitioning | str = "hive",
+) -> pd.DataFrame:
+    """Read a feather file or a folder of parquet files, materializing only the
+    requested columns and the rows that match the filters. Like DataFrame.filter,
+    requested columns that are not in the file are ignored."""
+    if Path(path).is_dir():
+        dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+    else:
+        dataset = ds.dataset(path, format="feather")
+
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+
+    expression = None if not filters else _filter_expression(filters, dataset.schema)
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
@@ -1,6 +1,20 @@
-from scripts.intel_tracker.heatmap_tracker import heatmap_data
+import argparse
+
+from scripts.intel_tracker.heatmap_tracker import heatmap_data, watch
 from scripts.logger import logger
 
 if __name__ == "__main__":
-    logger.info("Triggered heatmap update")
-    heatmap_data()
+    parser = argparse.ArgumentParser(description="Update the heatmap data")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running, and publish the data whenever the tracker changes",
+    )
+    args = parser.parse_args()
+
+    if args.watch:
+        logger.info("Watching the heatmap tracker")
+        watch()
+    else:
+        logger.info("Triggered heatmap update")
+        heatmap_data()
@@ -1,14 +1,28 @@
-from oda_data import ODAData, read_data, set_data_path
-from scripts.config import PATHS
+from functools import cache
 
-set_data_path(PATHS.raw_data)
+import pandas as pd
 
-oda = ODAData(
-    years=range(2018, 2022), donors=[4], currency="EUR", include_names=True
-).load_indicator("multisystem_multilateral_contributions_disbursement_gross")
+from scripts import common
 
-df = oda.get_data()
 
-df = df.groupby(
-    ["year", "donor_name", "channel_name"], as_index=False, dropna=False, observed=True
-)[["value"]].sum(numeric_only=True)
+@cache
+def multilateral_contributions() -> pd.DataFrame:
+    """Multilateral contributions of France (2018-2021, EUR) by channel. Loaded on
+    first use, so that importing this package doesn't load DAC data"""
+    common.init_oda_data()
+    from oda_data import ODAData
+
+    oda = ODAData(
+        years=range(2018, 2022), donors=[4], currency="EUR", include_names=True
+    ).load_indicator("multisystem_multilateral_contributions_disbursement_gross")
+
+    return (
+        oda.get_data()
+        .groupby(
+            ["year", "donor_name", "channel_name"],
+            as_index=False,
+            dropna=False,
+            observed=True,
+        )[["value"]]
+        .sum(numeric_only=True)
+    )
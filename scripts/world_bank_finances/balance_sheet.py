@@ -1,8 +1,10 @@
 from functools import partial
+from pathlib import Path
 
 import pandas as pd
 
-from scripts import config
+from scripts import config, outputs, readers
+from scripts.profiling import profiled
 from scripts.world_bank_finances import download
 
 file_name: str = f"IBRD_historical_balance_sheet"
@@ -31,11 +33,34 @@ download_financial_data = partial(
 )
 
 
-def read_raw_data(dataset: str) -> pd.DataFrame:
-    """Read the raw data from the WB"""
-    return pd.read_feather(config.PATHS.raw_data / f"{dataset}_data.feather").assign(
-        year=lambda d: pd.to_datetime(d.year, infer_datetime_format=True),
-        amount=lambda d: pd.to_numeric(d.amount),
+def _read_feather(
+    path: Path, columns: list[str] | None = None, filters: list | None = None
+) -> pd.DataFrame:
+    df = readers.scan(path, columns=columns, filters=filters)
+
+    if "year" in df.columns:
+        df = df.assign(
+            year=lambda d: pd.to_datetime(d.year, infer_datetime_format=True)
+        )
+    if "amount" in df.columns:
+        df = df.assign(amount=lambda d: pd.to_numeric(d.amount))
+
+    return df
+
+
+def read_raw_data(
+    dataset: str, columns: list[str] | None = None, filters: list | None = None
+) -> pd.DataFrame:
+    """Read the raw data from the WB.
+
+    Only the `columns` requested are read, and rows can be filtered while reading
+    with a list of (column, operator, value) tuples, for example
+    [("category", "in", ["Total Assets"])]"""
+    return readers.read_cached(
+        config.PATHS.raw_data / f"{dataset}_data.feather",
+        _read_feather,
+        columns=columns,
+        filters=filters,
     )
 
 
@@ -50,110 +75,151 @@ def get_indicator(data: pd.DataFrame, indicator: str) -> pd.DataFrame:
     )
 
 
-def _indicator_summary(indicators: list, indicator_name: str) -> pd.DataFrame:
-    data = read_raw_data(file_name)
+# Indicators that are added up into each of the aggregates used by the ratios
+TOTAL_CAPITAL: list = [
+    # "subscribed_capital",
+    "uncalled_capital",
+    "paid_in_capital",
+    "special_reserve",
+    "general_reserve",
+    "cumulative_fair_value_adjustments",
+]
+
+USABLE_PAID_IN_CAPITAL: list = [
+    "paid_in_capital",
+    "deferred_amounts",
+    "receivable_amounts",
+    "demand_obligations",
+    "mov_payable",
+]
+
+USABLE_EQUITY: list = [
+    # Usable paid-in capital
+    *USABLE_PAID_IN_CAPITAL,
+    # Reserves
+    "special_reserve",
+    "general_reserve",
+    # Adjustments
+    "cumulative_fair_value_adjustments",
+]
+
+LOANS_OUTSTANDING: list = ["total_loans_outstanding"]
+
+
+def _read_indicator_matrix(path: Path) -> pd.DataFrame:
+    """Pivot the balance sheet into a year x indicator matrix, with one column per
+    key of INDICATORS. Indicators missing for a year are NaN."""
+    categories = {v.lower(): k for k, v in INDICATORS.items()}
 
-    dfs = []
+    return (
+        _read_feather(path, columns=["category", "year", "amount"])
+        .assign(indicator=lambda d: d.category.str.lower().map(categories))
+        .dropna(subset=["indicator"])
+        .groupby(["year", "indicator"])["amount"]
+        .sum()
+        .unstack("indicator")
+        .reindex(columns=list(INDICATORS))
+    )
 
-    for indicator in indicators:
-        dfs.append(data.pipe(get_indicator, indicator=indicator))
 
-    return (
-        pd.concat(dfs, ignore_index=True)
-        .assign(indicator=indicator_name)
-        .groupby(["indicator", "year"], as_index=False, dropna=False)
-        .sum(numeric_only=True)
+@profiled
+def indicator_matrix() -> pd.DataFrame:
+    """Return the IBRD balance sheet as a year x indicator matrix. The matrix is
+    built once and reused until the raw data changes."""
+    return readers.read_cached(
+        config.PATHS.raw_data / f"{file_name}_data.feather", _read_indicator_matrix
     )
 
 
-def get_subscribed_capital() -> pd.DataFrame:
-    indicators = [
-        # "subscribed_capital",
-        "uncalled_capital",
-        "paid_in_capital",
-        "special_reserve",
-        "general_reserve",
-        "cumulative_fair_value_adjustments",
-    ]
+def _combine(matrix: pd.DataFrame, indicators: list) -> pd.Series:
+    """Add up indicators for every year. Years with none of them are NaN."""
+    return matrix[indicators].sum(axis=1, min_count=1)
+
+
+@profiled
+def _indicator_summary(indicators: list, indicator_name: str) -> pd.DataFrame:
+    return (
+        _combine(indicator_matrix(), indicators)
+        .dropna()
+        .rename("amount")
+        .reset_index()
+        .assign(indicator=indicator_name)
+        .filter(["indicator", "year", "amount"], axis=1)
+    )
 
-    return _indicator_summary(indicators, "total_capital")
 
+get_subscribed_capital = partial(_indicator_summary, TOTAL_CAPITAL, "total_capital")
 
 get_paid_in_capital = partial(
     _indicator_summary, ["paid_in_capital"], "paid_in_capital"
 )
 
+get_usable_paid_in_capital = partial(
+    _indicator_summary, USABLE_PAID_IN_CAPITAL, "usable_paid_in_capital"
+)
 
-def get_usable_paid_in_capital() -> pd.DataFrame:
-    indicators = [
-        "paid_in_capital",
-        "deferred_amounts",
-        "receivable_amounts",
-        "demand_obligations",
-        "mov_payable",
-    ]
-
-    return _indicator_summary(indicators, "usable_paid_in_capital")
+get_usable_equity = partial(_indicator_summary, USABLE_EQUITY, "usable_equity")
 
+get_loans_outstanding = partial(_indicator_summary, LOANS_OUTSTANDING, "loans_exposure")
 
-def get_usable_equity() -> pd.DataFrame:
-    indicators = [
-        # Usable paid-in capital
-        "paid_in_capital",
-        "deferred_amounts",
-        "receivable_amounts",
-        "demand_obligations",
-        "mov_payable",
-        # Reserves
-        "special_reserve",
-        "general_reserve",
-        # Adjustments
-        "cumulative_fair_value_adjustments",
-    ]
 
-    return _indicator_summary(indicators, "usable_equity")
+def el_ratio_value(usable_equity, loans_exposure):
+    """Usable equity to loans (E/L) ratio, in percent. Works on numbers, Series
+    and NumPy arrays alike."""
+    return 100 * usable_equity / loans_exposure
 
 
-get_loans_outstanding = partial(
-    _indicator_summary, ["total_loans_outstanding"], "loans_exposure"
-)
+def gearing_ratio_value(total_capital, loans_exposure):
+    """Loans to total capital (gearing) ratio, in percent. Works on numbers,
+    Series and NumPy arrays alike."""
+    return 100 * loans_exposure / total_capital
 
 
-def gearing_ratio() -> pd.DataFrame:
-    df = get_subscribed_capital()
-    df2 = get_loans_outstanding()
+def _aggregates(**aggregates: list) -> pd.DataFrame:
+    """Build a year x aggregate frame, keeping the years with any of them"""
+    matrix = indicator_matrix()
 
     return (
-        pd.concat([df, df2], ignore_index=True)
-        .pivot(index="year", columns="indicator", values="amount")
-        .assign(ratio=lambda d: round(100 * d.loans_exposure / d.total_capital, 2))
+        pd.DataFrame({k: _combine(matrix, v) for k, v in aggregates.items()})
+        .dropna(how="all")
+        .rename_axis(columns="indicator")
         .reset_index()
+    )
+
+
+@profiled
+def gearing_ratio() -> pd.DataFrame:
+    return (
+        _aggregates(loans_exposure=LOANS_OUTSTANDING, total_capital=TOTAL_CAPITAL)
+        .assign(
+            ratio=lambda d: round(
+                gearing_ratio_value(d.total_capital, d.loans_exposure), 2
+            )
+        )
         .query("year.dt.year >= 1960")
         .sort_values("year", ascending=False)
         .reset_index(drop=True)
     )
 
 
+@profiled
 def el_ratio() -> pd.DataFrame:
-    df = get_usable_equity()
-    df2 = get_loans_outstanding()
+    data = _aggregates(loans_exposure=LOANS_OUTSTANDING, usable_equity=USABLE_EQUITY)
 
-    data = (
-        pd.concat([df, df2], ignore_index=True)
-        .pivot(index="year", columns="indicator", values="amount")
-        .reset_index()
-    )
     # manual correction of latest data
     data.loc[lambda d: d.year == "2022-06-30", "usable_equity"] = 50_481
 
     return (
-        data.assign(ratio=lambda d: round(100 * d.usable_equity / d.loans_exposure, 1))
+        data.assign(
+            ratio=lambda d: round(el_ratio_value(d.usable_equity, d.loans_exposure), 1)
+        )
         .query("year.dt.year >= 1960")
         .sort_values("year", ascending=False)
         .reset_index(drop=True)
     )
 
 
+@profiled
 def tool_export_ratios():
     e_ratio = el_ratio()
     g_ratio = gearing_ratio()
@@ -166,7 +232,7 @@ def tool_export_ratios():
         .rename(columns={"ratio_el": "el_ratio", "ratio_gearing": "gearing_ratio"})
     )
 
-    df.to_csv(config.PATHS.output / "tool" / "ratios.csv", index=False)
+    outputs.export(df, "tool/ratios")
 
 
 if __name__ == "__main__":
@@ -1,52 +1,390 @@
+import csv
+import io
+import json
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-from sodapy import Socrata
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import requests
 
-from scripts import config
+from scripts import config, fetch
 from scripts.logger import logger
 
+# Number of rows requested per Socrata page
+PAGE_SIZE: int = 50_000
+
+# Maximum number of pages downloaded at the same time
+MAX_WORKERS: int = 4
+
+# Number of attempts made for each page before giving up
+RETRIES: int = 3
+
+# Hive partitioning used when the data is saved as parquet: one folder per snapshot
+PARTITIONING = ds.partitioning(
+    pa.schema([("end_of_period", pa.date32())]), flavor="hive"
+)
+
+DTYPES: dict = {
+    "end_of_period": "datetime64[ns]",
+    "loan_number": "category",
+    "region": "category",
+    "country_code": "category",
+    "country": "category",
+    "borrower": "category",
+    "guarantor_country_code": "category",
+    "guarantor": "category",
+    "loan_type": "category",
+    "loan_status": "category",
+    "interest_rate": "float64",
+    "project_id": "category",
+    "project_name_": "category",
+    "original_principal_amount": "float64",
+    "cancelled_amount": "float64",
+    "undisbursed_amount": "float64",
+    "disbursed_amount": "float64",
+    "repaid_to_ibrd": "float64",
+    "due_to_ibrd": "float64",
+    "exchange_adjustment": "float64",
+    "borrower_s_obligation": "float64",
+    "sold_3rd_party": "float64",
+    "repaid_3rd_party": "float64",
+    "due_3rd_party": "float64",
+    "loans_held": "float64",
+    "first_repayment_date": "datetime64[ns]",
+    "last_repayment_date": "datetime64[ns]",
+    "agreement_signing_date": "datetime64[ns]",
+    "board_approval_date": "datetime64[ns]",
+    "effective_date_most_recent_": "datetime64[ns]",
+    "closed_date_most_recent_": "datetime64[ns]",
+    "last_disbursement_date": "datetime64[ns]",
+}
+
+# Arrow types used to parse the columns of each dtype in DTYPES. Any other column
+# is kept as a string, as returned by Socrata
+ARROW_TYPES: dict = {
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "float64": pa.float64(),
+    "datetime64[ns]": pa.timestamp("ns"),
+}
+
+
+def _resource_url(file: str, domain: str, extension: str = "json") -> str:
+    """Return the SODA endpoint for a Socrata dataset"""
+    return f"{domain}/resource/{file}.{extension}"
+
 
-def download_data(file: str, file_name: str) -> None:
-    client = Socrata("finances.worldbank.org", None)
-    results = client.get(file, limit=2_000_000)
-
-    dtypes = {
-        "end_of_period": "datetime64[ns]",
-        "loan_number": "category",
-        "region": "category",
-        "country_code": "category",
-        "country": "category",
-        "borrower": "category",
-        "guarantor_country_code": "category",
-        "guarantor": "category",
-        "loan_type": "category",
-        "loan_status": "category",
-        "interest_rate": "float64",
-        "project_id": "category",
-        "project_name_": "category",
-        "original_principal_amount": "float64",
-        "cancelled_amount": "float64",
-        "undisbursed_amount": "float64",
-        "disbursed_amount": "float64",
-        "repaid_to_ibrd": "float64",
-        "due_to_ibrd": "float64",
-        "exchange_adjustment": "float64",
-        "borrower_s_obligation": "float64",
-        "sold_3rd_party": "float64",
-        "repaid_3rd_party": "float64",
-        "due_3rd_party": "float64",
-        "loans_held": "float64",
-        "first_repayment_date": "datetime64[ns]",
-        "last_repayment_date": "datetime64[ns]",
-        "agreement_signing_date": "datetime64[ns]",
-        "board_approval_date": "datetime64[ns]",
-        "effective_date_most_recent_": "datetime64[ns]",
-        "closed_date_most_recent_": "datetime64[ns]",
-        "last_disbursement_date": "datetime64[ns]",
+def _get(
+    session: requests.Session, url: str, params: dict, retries: int = RETRIES
+) -> requests.Response:
+    """GET a SODA endpoint, retrying with a backoff on connection errors"""
+    for attempt in range(1, retries + 1):
+        try:
+            response = session.get(url, params=params, timeout=120)
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            logger.debug(f"Retrying {url} ({attempt}/{retries}): {e}")
+            time.sleep(2**attempt)
+
+
+def _get_json(
+    session: requests.Session, url: str, params: dict, retries: int = RETRIES
+) -> list[dict]:
+    return _get(session, url, params, retries).json()
+
+
+def _parse_csv(content: bytes) -> pa.Table:
+    """Parse SODA CSV results straight into an Arrow table, typed with DTYPES:
+    categories are dictionary encoded and dates are timestamps. Columns that are
+    not in DTYPES are kept as strings. Empty values are read as nulls."""
+    if not content.strip():
+        return pa.table({})
+
+    header = next(csv.reader([content.split(b"\n", 1)[0].decode("utf-8")]))
+    column_types = {
+        column: ARROW_TYPES.get(DTYPES.get(column), pa.string()) for column in header
     }
-    df = pd.DataFrame.from_records(results)
 
-    dtypes = {k: v for k, v in dtypes.items() if k in df.columns}
+    return pa_csv.read_csv(
+        io.BytesIO(content),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types, strings_can_be_null=True
+        ),
+    ).unify_dictionaries()
+
+
+def _sort_dictionaries(table: pa.Table) -> pa.Table:
+    """Give every dictionary column a single, sorted dictionary, so that
+    categories come out in the same order as with pandas' astype("category")"""
+    table = table.unify_dictionaries()
+
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if not pa.types.is_dictionary(field.type) or column.num_chunks == 0:
+            continue
+
+        dictionary = column.chunk(0).dictionary
+        order = pc.sort_indices(dictionary).to_numpy()
+        position = np.empty(len(order), dtype="int32")
+        position[order] = np.arange(len(order), dtype="int32")
+
+        chunks = [
+            pa.DictionaryArray.from_arrays(
+                pc.take(pa.array(position), chunk.indices), dictionary.take(order)
+            )
+            for chunk in column.chunks
+        ]
+        table = table.set_column(i, field, pa.chunked_array(chunks, field.type))
+
+    return table
+
+
+def _where(params: dict, where: str | None) -> dict:
+    """Add a SoQL $where clause to the request parameters, if provided"""
+    return params if where is None else params | {"$where": where}
+
+
+def count_rows(
+    file: str, domain: str = config.SOCRATA_DOMAIN, where: str | None = None
+) -> int:
+    """Count the rows of a Socrata dataset, optionally matching a SoQL $where"""
+    result = _get_json(
+        fetch.session(),
+        _resource_url(file, domain),
+        _where({"$select": "count(*) AS count"}, where),
+    )
+    return int(result[0]["count"])
+
+
+def _page_path(pages_dir: Path, page: int) -> Path:
+    return pages_dir / f"page_{page:05d}.feather"
+
+
+def _prepare_pages_dir(pages_dir: Path, manifest: dict) -> None:
+    """Create the folder for the pages of a download. Pages left by a previous
+    download are kept only if they were fetched with the same settings"""
+    manifest_path = pages_dir / "manifest.json"
+
+    if manifest_path.exists():
+        with open(manifest_path, "r") as f:
+            if json.load(f) == manifest:
+                return
+        logger.info(f"Dataset changed since last attempt, restarting {pages_dir.name}")
+        shutil.rmtree(pages_dir)
+
+    pages_dir.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+
+def _download_page(
+    session: requests.Session,
+    file: str,
+    page: int,
+    page_size: int,
+    pages_dir: Path,
+    domain: str,
+    where: str | None = None,
+) -> None:
+    """Download a single page and write it to disk. Pages already on disk are
+    skipped, which is what makes downloads resumable"""
+    path = _page_path(pages_dir, page)
+
+    if path.exists():
+        return
+
+    params = {"$limit": page_size, "$offset": page * page_size, "$order": ":id"}
+    response = _get(session, _resource_url(file, domain, "csv"), _where(params, where))
+
+    # write to a temporary file first so that an interrupted write is not
+    # mistaken for a finished page
+    tmp = path.with_suffix(".tmp")
+    feather.write_feather(_parse_csv(response.content), tmp)
+    tmp.replace(path)
 
-    df.astype(dtypes).to_feather(config.PATHS.raw_data / f"{file_name}_data.feather")
+
+def download_pages(
+    file: str,
+    file_name: str,
+    page_size: int = PAGE_SIZE,
+    max_workers: int = MAX_WORKERS,
+    domain: str = config.SOCRATA_DOMAIN,
+    where: str | None = None,
+) -> list[Path]:
+    """Download a Socrata dataset page by page, using a pool of workers.
+
+    Each page is stored under PATHS.pages as soon as it arrives. If the download
+    fails, calling this function again only fetches the missing pages. A SoQL
+    `where` clause can be passed to download only part of the dataset."""
+
+    rows = count_rows(file, domain=domain, where=where)
+    pages = max(1, -(-rows // page_size))
+
+    pages_dir = config.PATHS.pages / file_name
+    _prepare_pages_dir(
+        pages_dir,
+        {"file": file, "rows": rows, "page_size": page_size, "where": where},
+    )
+
+    logger.debug(f"Downloading {rows} rows of {file_name} in {pages} pages")
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        futures = [
+            pool.submit(
+                _download_page,
+                fetch.session(),
+                file,
+                page,
+                page_size,
+                pages_dir,
+                domain,
+                where,
+            )
+            for page in range(pages)
+        ]
+        for future in futures:
+            future.result()
+
+    return [_page_path(pages_dir, page) for page in range(pages)]
+
+
+def _write_feather(table: pa.Table, path: Path, append: bool) -> None:
+    """Write the data as a single feather file. A feather file cannot be appended
+    to, so appending reads the whole file, adds the new rows and rewrites it:
+    the cost grows with the stored data, not with the new rows."""
+    # write to a temporary file first so that readers never see a partial file
+    tmp = path.with_suffix(".tmp")
+
+    if append and path.exists():
+        df = pd.concat([pd.read_feather(path), table.to_pandas()], ignore_index=True)
+        dtypes = {k: v for k, v in DTYPES.items() if k in df.columns}
+        df.astype(dtypes).to_feather(tmp)
+    else:
+        feather.write_feather(table, tmp)
+
+    tmp.replace(path)
+
+
+def _write_parquet(table: pa.Table, path: Path, append: bool) -> None:
+    """Write the data as a parquet dataset partitioned by end_of_period. Categorical
+    columns are dictionary encoded and every file stores column statistics."""
+    if "end_of_period" not in table.column_names:
+        raise ValueError("Only data with an end_of_period can be saved as parquet")
+
+    table = table.set_column(
+        table.schema.get_field_index("end_of_period"),
+        "end_of_period",
+        table["end_of_period"].cast(pa.date32(), safe=False),
+    )
+
+    options = ds.ParquetFileFormat().make_write_options(
+        use_dictionary=True, write_statistics=True, compression="zstd"
+    )
+
+    def write(directory: Path) -> None:
+        ds.write_dataset(
+            table,
+            directory,
+            format="parquet",
+            partitioning=PARTITIONING,
+            file_options=options,
+            basename_template=f"part-{time.time_ns()}-{{i}}.parquet",
+            existing_data_behavior="delete_matching",
+        )
+
+    # new snapshots are new partitions, so appending doesn't touch the rest
+    if append and path.exists():
+        write(path)
+        return
+
+    # otherwise build the dataset next to the old one and swap them
+    tmp, old = path.with_suffix(".tmp"), path.with_suffix(".old")
+    shutil.rmtree(tmp, ignore_errors=True)
+    write(tmp)
+    if path.exists():
+        path.rename(old)
+    tmp.rename(path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def convert_to_parquet(file_name: str) -> None:
+    """Convert a dataset stored as a feather file into a partitioned parquet
+    dataset, and remove the feather file"""
+    path = raw_data_path(file_name)
+    _write_parquet(feather.read_table(path), raw_data_path(file_name, "parquet"), False)
+    path.unlink()
+
+    logger.info(f"Converted {path.name} to a parquet dataset")
+
+
+def raw_data_path(file_name: str, output_format: str = "feather") -> Path:
+    """Return where a dataset is stored in PATHS.raw_data for a given format"""
+    if output_format == "parquet":
+        return config.PATHS.raw_data / f"{file_name}_data"
+    return config.PATHS.raw_data / f"{file_name}_data.feather"
+
+
+def download_data(
+    file: str,
+    file_name: str,
+    page_size: int = PAGE_SIZE,
+    max_workers: int = MAX_WORKERS,
+    domain: str = config.SOCRATA_DOMAIN,
+    where: str | None = None,
+    append: bool = False,
+    output_format: str = "feather",
+) -> bool:
+    """Download a Socrata dataset and save it in PATHS.raw_data. Returns whether
+    any data was written.
+
+    If `append` is True, the downloaded rows (usually restricted with `where`) are
+    added to the data already stored in PATHS.raw_data instead of replacing it.
+    For parquet this only writes the new partitions, but a feather file is read
+    and rewritten in full.
+
+    `output_format` can be "feather" (a single file) or "parquet" (a folder with
+    one partition per end_of_period, for datasets that have one)."""
+    if output_format not in ("feather", "parquet"):
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    path = raw_data_path(file_name, output_format)
+
+    pages = download_pages(
+        file=file,
+        file_name=file_name,
+        page_size=page_size,
+        max_workers=max_workers,
+        domain=domain,
+        where=where,
+    )
+
+    # pages with no rows may also have no columns
+    tables = [t for t in map(feather.read_table, pages) if t.num_columns]
+    table = _sort_dictionaries(pa.concat_tables(tables)) if tables else pa.table({})
+
+    if append and table.num_rows == 0:
+        shutil.rmtree(config.PATHS.pages / file_name)
+        logger.info(f"No new rows for {file_name}_data")
+        return False
+
+    if output_format == "parquet":
+        _write_parquet(table, path, append)
+    else:
+        _write_feather(table, path, append)
+
+    # The download is complete, so the pages are no longer needed
+    shutil.rmtree(config.PATHS.pages / file_name)
 
     logger.info(f"Downloaded {file_name}_data")
+
+    return True
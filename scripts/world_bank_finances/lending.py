@@ -1,10 +1,16 @@
 import pandas as pd
 
-from scripts.world_bank_finances.loans_data import file_name, read_raw_data
+from scripts.world_bank_finances.loans_data import (
+    CUBE_VALUES,
+    as_of,
+    file_name,
+    read_lending_cube,
+)
 
 
 def cumulative_lending(end_of_period: str | list[str]):
-    """Calculate the cumulative lending since a starting date"""
+    """Calculate the cumulative lending since a starting date, as of one or more
+    dates (each date uses the latest snapshot on or before it)"""
     exclude = ["Draft", "Cancelled", "Fully Cancelled"]
     cols = [
         "country",
@@ -18,13 +24,9 @@ def cumulative_lending(end_of_period: str | list[str]):
         "borrower_s_obligation",
     ]
 
-    if isinstance(end_of_period, str):
-        end_of_period = [end_of_period]
-
     df = (
-        read_raw_data(file_name)
-        .query(f"loan_status not in {exclude}")
-        .loc[lambda d: d.end_of_period.isin(end_of_period)]
+        as_of(file_name, end_of_period)
+        .loc[lambda d: ~d.loan_status.isin(exclude)]
         .filter(cols, axis=1)
         .groupby(["country", "end_of_period"], observed=True, dropna=False)
         .sum(numeric_only=True)
@@ -36,6 +38,58 @@ def cumulative_lending(end_of_period: str | list[str]):
     return df
 
 
+def country_flows(
+    dates: str | list[str] | None = None, exclude: list[str] | None = None
+) -> pd.DataFrame:
+    """Change in each monetary column (and in outstanding loans) between
+    consecutive snapshots, for every country, in billions.
+
+    By default every snapshot is used. With `dates`, the snapshots as of those
+    dates are used instead (e.g. June 30 of each year, for yearly flows). Since
+    snapshots can be irregularly spaced, each row has the start of its period
+    and its length in days. A country without loans in a snapshot counts as
+    zero, so loans that appear or drop out are flows too."""
+    if exclude is None:
+        exclude = ["Draft", "Cancelled", "Fully Cancelled"]
+
+    cube = read_lending_cube(file_name) if dates is None else as_of(file_name, dates)
+
+    stocks = (
+        cube.loc[lambda d: ~d.loan_status.isin(exclude)]
+        .groupby(["country", "end_of_period"], observed=True)[CUBE_VALUES]
+        .sum()
+        .assign(outstanding=lambda d: d.due_to_ibrd + d.exchange_adjustment)
+    )
+
+    # Every country at every snapshot, sorted by country and then snapshot
+    countries = stocks.index.get_level_values("country").unique().sort_values()
+    snapshots = stocks.index.get_level_values("end_of_period").unique().sort_values()
+    stocks = stocks.reindex(
+        pd.MultiIndex.from_product([countries, snapshots]), fill_value=0
+    )
+
+    # A single diff over the whole frame. The rows of each country's first
+    # snapshot would diff against the previous country, so they are dropped
+    previous = pd.Series(snapshots[:-1], index=snapshots[1:])
+
+    return (
+        stocks.diff()
+        .div(1e9)
+        .reset_index()
+        .loc[lambda d: d.end_of_period != snapshots[0]]
+        .assign(
+            period_start=lambda d: d.end_of_period.map(previous),
+            days=lambda d: (d.end_of_period - d.period_start).dt.days,
+        )
+        .filter(
+            ["country", "period_start", "end_of_period", "days"]
+            + CUBE_VALUES
+            + ["outstanding"]
+        )
+        .reset_index(drop=True)
+    )
+
+
 def loans_outstanding_ts() -> pd.DataFrame:
     dates = [f"{y}-06-30" for y in range(2011, 2024)] + ["2022-12-31"]
 
@@ -86,10 +140,9 @@ dates = [f"{y}-06-30" for y in range(2011, 2024)]
 
 def latest_snapshot():
     return (
-        read_raw_data(file_name)
+        as_of(file_name, dates)
+        .loc[lambda d: ~d.loan_status.isin(exclude)]
         .filter(cols, axis=1)
-        .query(f"loan_status not in {exclude}")
-        .query("end_of_period in @dates")
         .groupby(["end_of_period"], observed=True, dropna=False)
         .sum(numeric_only=True)
         .div(1e9)
@@ -99,10 +152,9 @@ def latest_snapshot():
 
 def yearly_snapshot():
     return (
-        read_raw_data(file_name)
+        as_of(file_name, dates)
+        .loc[lambda d: ~d.loan_status.isin(exclude)]
         .filter(cols, axis=1)
-        .query(f"loan_status not in {exclude}")
-        .query("end_of_period in @dates")
         .groupby(["end_of_period"], observed=True, dropna=False)
         .sum(numeric_only=True)
         .div(1e9)
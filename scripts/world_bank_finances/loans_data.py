@@ -1,21 +1,217 @@
-from functools import partial
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-from scripts import config
+from scripts import config, readers
+from scripts.logger import logger
 from scripts.world_bank_finances import download
 
 file_name = "ibrd_historical_loan"
 
-download_loan_data = partial(
-    download.download_data, file="zucq-nrc3", file_name=file_name
-)
+# Keys and monetary columns of the lending cube, which holds the loan history
+# summed by country, snapshot and loan status
+CUBE_KEYS: list = ["country", "end_of_period", "loan_status"]
+CUBE_VALUES: list = [
+    "disbursed_amount",
+    "repaid_to_ibrd",
+    "due_to_ibrd",
+    "exchange_adjustment",
+    "undisbursed_amount",
+    "borrower_s_obligation",
+]
 
 
-def read_raw_data(dataset: str) -> pd.DataFrame:
-    """Read the raw data from the WB"""
-    return pd.read_feather(config.PATHS.raw_data / f"{dataset}_data.feather").assign(
+def download_loan_data(**kwargs) -> None:
+    """Download the IBRD loan history and build its lending cube, unless there
+    was nothing new to download. Keyword arguments are passed on to
+    download.download_data"""
+    if download.download_data(file="zucq-nrc3", file_name=file_name, **kwargs):
+        build_lending_cube(file_name)
+
+
+def _read_raw(
+    path: Path, columns: list[str] | None = None, filters: list | None = None
+) -> pd.DataFrame:
+    df = readers.scan(
+        path, columns=columns, filters=filters, partitioning=download.PARTITIONING
+    )
+
+    if "end_of_period" not in df.columns:
+        return df
+
+    return df.assign(
         end_of_period=lambda d: pd.to_datetime(
             d.end_of_period, infer_datetime_format=True
         )
     )
+
+
+def _stored_format(dataset: str) -> str:
+    """Return the format of the data stored in raw_data, preferring parquet"""
+    if download.raw_data_path(dataset, "parquet").exists():
+        return "parquet"
+    return "feather"
+
+
+def raw_data_path(dataset: str) -> Path:
+    """Return the path of the stored loans data (a parquet folder or feather file)"""
+    return download.raw_data_path(dataset, _stored_format(dataset))
+
+
+def read_raw_data(
+    dataset: str, columns: list[str] | None = None, filters: list | None = None
+) -> pd.DataFrame:
+    """Read the raw data from the WB.
+
+    Only the `columns` requested are read, and rows can be filtered while reading
+    with a list of (column, operator, value) tuples, for example
+    [("loan_status", "not in", ["Draft"]), ("end_of_period", "in", dates)]
+
+    If the data was downloaded as a parquet dataset, that dataset is read instead
+    of the feather file, and only the end_of_period partitions needed are opened."""
+    return readers.read_cached(
+        raw_data_path(dataset),
+        _read_raw,
+        columns=columns,
+        filters=filters,
+    )
+
+
+def latest_end_of_period(dataset: str) -> pd.Timestamp | None:
+    """Return the latest end_of_period stored in raw_data, if the data exists"""
+    path = raw_data_path(dataset)
+
+    if not path.exists():
+        return None
+
+    return _read_raw(path, columns=["end_of_period"]).end_of_period.max()
+
+
+def sync_loan_data(output_format: str = "parquet") -> None:
+    """Download only the loan snapshots that are newer than the latest
+    end_of_period already stored in raw_data, and append them to it.
+
+    By default the history is kept as a parquet dataset partitioned by
+    end_of_period, so a sync only writes the partitions of the new snapshots. A
+    history stored as feather is converted to parquet first (once). With
+    `output_format="feather"`, every sync reads and rewrites the whole file."""
+    if output_format == "parquet" and _stored_format(file_name) == "feather":
+        if raw_data_path(file_name).exists():
+            download.convert_to_parquet(file_name)
+
+    latest = latest_end_of_period(file_name)
+
+    if latest is None or pd.isna(latest):
+        logger.info(f"No local {file_name} data, downloading the full history")
+        download_loan_data(output_format=output_format)
+        return
+
+    download_loan_data(
+        where=f"end_of_period > '{latest:%Y-%m-%dT%H:%M:%S.000}'",
+        append=True,
+        output_format=_stored_format(file_name),
+    )
+
+
+def cube_path(dataset: str) -> Path:
+    """Return the path of the lending cube, stored next to the raw data"""
+    return config.PATHS.raw_data / f"{dataset}_cube.feather"
+
+
+def build_lending_cube(dataset: str) -> None:
+    """Sum the monetary columns of the loan history by country, end_of_period and
+    loan_status, and save the result next to the raw data, sorted by
+    end_of_period"""
+    path = cube_path(dataset)
+
+    # Read directly rather than through the reader cache: the projection is only
+    # needed here, and would otherwise stay in memory for the rest of the run
+    cube = (
+        _read_raw(raw_data_path(dataset), columns=CUBE_KEYS + CUBE_VALUES)
+        .groupby(CUBE_KEYS, observed=True, dropna=False)[CUBE_VALUES]
+        .sum()
+        .reset_index()
+        .sort_values("end_of_period", kind="stable", ignore_index=True)
+    )
+
+    tmp = path.with_suffix(".tmp")
+    cube.to_feather(tmp)
+    tmp.replace(path)
+
+    logger.debug(f"Built lending cube for {dataset} ({len(cube)} rows)")
+
+
+def _current_cube_path(dataset: str) -> Path:
+    """Return the path of the lending cube, building it first if it is missing or
+    older than the raw data"""
+    path = cube_path(dataset)
+
+    if not path.exists() or readers.modified(path) < readers.modified(
+        raw_data_path(dataset)
+    ):
+        build_lending_cube(dataset)
+
+    return path
+
+
+def _read_cube(path: Path, filters: list | None = None) -> pd.DataFrame:
+    """Read a lending cube, making sure it is sorted by end_of_period (cubes built
+    by older versions of build_lending_cube are not)"""
+    cube = _read_raw(path, filters=filters)
+
+    if not cube.end_of_period.is_monotonic_increasing:
+        cube = cube.sort_values("end_of_period", kind="stable", ignore_index=True)
+
+    return cube
+
+
+def read_lending_cube(dataset: str, filters: list | None = None) -> pd.DataFrame:
+    """Read the lending cube of a dataset, building it first if it is missing or
+    older than the raw data. Rows can be filtered as in read_raw_data"""
+    path = _current_cube_path(dataset)
+
+    # Without filters, this is the same cache entry as the one used by as_of
+    if filters is None:
+        return readers.read_cached(path, _read_cube)
+    return readers.read_cached(path, _read_cube, filters=filters)
+
+
+def _read_snapshot_index(path: Path) -> pd.DataFrame:
+    dates = readers.read_cached(path, _read_cube).end_of_period.to_numpy()
+    starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+
+    return pd.DataFrame(
+        {
+            "end_of_period": dates[starts],
+            "start": starts,
+            "stop": np.r_[starts[1:], len(dates)],
+        }
+    ).loc[lambda d: d.end_of_period.notna()]
+
+
+def snapshot_index(dataset: str) -> pd.DataFrame:
+    """The distinct end_of_period snapshots of the lending cube, in order, with the
+    range of rows (start, stop) that each one takes in the cube"""
+    return readers.read_cached(_current_cube_path(dataset), _read_snapshot_index)
+
+
+def as_of(dataset: str, dates: str | list[str]) -> pd.DataFrame:
+    """The lending cube as of one or more dates: for each date, the rows of the
+    latest snapshot on or before that date. Snapshots are found by binary search
+    on the snapshot index, and each appears once even if several dates fall on
+    it. Dates before the first snapshot have no rows."""
+    path = _current_cube_path(dataset)
+    cube = readers.read_cached(path, _read_cube)
+    index = readers.read_cached(path, _read_snapshot_index)
+
+    dates = pd.to_datetime(pd.Series(dates if isinstance(dates, list) else [dates]))
+    positions = np.searchsorted(
+        index.end_of_period.to_numpy(), dates.to_numpy(), side="right"
+    )
+    positions = np.unique(positions[positions > 0] - 1)
+
+    ranges = index[["start", "stop"]].to_numpy()[positions]
+    rows = np.concatenate([np.arange(start, stop) for start, stop in ranges] + [[]])
+
+    return cube.iloc[rows.astype("int64")].reset_index(drop=True)
@@ -0,0 +1,112 @@
+"""Scenarios for the capital adequacy tool. Given values (or ranges of values) for
+usable equity, callable capital and lending, compute the E/L and gearing ratios
+they imply, or the lending that would reach a target ratio.
+
+As in the tool, total capital is usable equity plus callable (uncalled) capital,
+and every amount is in billions of USD."""
+
+import numpy as np
+import pandas as pd
+
+from scripts import config, outputs
+from scripts.world_bank_finances.balance_sheet import (
+    el_ratio_value,
+    gearing_ratio_value,
+)
+
+# Metrics of the tool that define the axes of the scenario grid
+GRID_METRICS: list = ["useable", "uncalled", "loans"]
+
+
+def scenario_grid(useable, uncalled, loans) -> pd.DataFrame:
+    """Compute the E/L and gearing ratios for every combination of the usable
+    equity, callable capital and lending values provided."""
+    useable, uncalled, loans = np.meshgrid(
+        np.asarray(useable, dtype="float64"),
+        np.asarray(uncalled, dtype="float64"),
+        np.asarray(loans, dtype="float64"),
+        indexing="ij",
+        sparse=True,
+    )
+
+    el = el_ratio_value(useable, loans)
+    gearing = gearing_ratio_value(useable + uncalled, loans)
+
+    useable, uncalled, loans, el, gearing = np.broadcast_arrays(
+        useable, uncalled, loans, el, gearing
+    )
+
+    return pd.DataFrame(
+        {
+            "useable": useable.ravel(),
+            "uncalled": uncalled.ravel(),
+            "loans": loans.ravel(),
+            "el_ratio": el.ravel().round(1),
+            "gearing_ratio": gearing.ravel().round(2),
+        }
+    )
+
+
+def lending_headroom(useable, uncalled, el_target=None, gearing_target=None):
+    """Return the lending that reaches a target E/L ratio, a target gearing ratio
+    or, if both are given, the lower of the two. Inputs can be numbers or arrays,
+    which are broadcast against each other."""
+    if el_target is None and gearing_target is None:
+        raise ValueError("Provide an E/L target, a gearing target, or both")
+
+    useable = np.asarray(useable, dtype="float64")
+    uncalled = np.asarray(uncalled, dtype="float64")
+
+    limits = []
+
+    if el_target is not None:
+        limits.append(100 * useable / np.asarray(el_target, dtype="float64"))
+
+    if gearing_target is not None:
+        limits.append(
+            np.asarray(gearing_target, dtype="float64") * (useable + uncalled) / 100
+        )
+
+    return np.minimum.reduce(np.broadcast_arrays(*limits))
+
+
+def target_scenarios(useable, uncalled, el_targets) -> pd.DataFrame:
+    """For each target E/L ratio, compute the lending that reaches it and the
+    gearing ratio that lending implies."""
+    el_targets = np.asarray(el_targets, dtype="float64")
+    loans = lending_headroom(useable, uncalled, el_target=el_targets)
+
+    return pd.DataFrame(
+        {
+            "useable": useable,
+            "uncalled": uncalled,
+            "loans": loans.round(2),
+            "el_ratio": el_targets,
+            "gearing_ratio": gearing_ratio_value(useable + uncalled, loans).round(2),
+        }
+    )
+
+
+def _metric_ranges() -> pd.DataFrame:
+    return pd.read_csv(
+        config.PATHS.output / "tool" / "metrics.csv", encoding="utf-8-sig"
+    ).set_index("metric")
+
+
+def tool_export_scenario_grid(steps: int = 25) -> None:
+    """Save a grid of scenarios covering the range of each metric in the tool,
+    with `steps` values per metric"""
+    metrics = _metric_ranges()
+
+    axes = [
+        np.linspace(metrics.at[m, "min"], metrics.at[m, "max"], steps).round(3)
+        for m in GRID_METRICS
+    ]
+
+    df = scenario_grid(*axes)
+
+    outputs.export(df, "tool/scenario_grid")
+
+
+if __name__ == "__main__":
+    tool_export_scenario_grid()
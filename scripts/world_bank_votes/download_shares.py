@@ -1,35 +1,63 @@
+import io
+
+import numpy as np
 import pandas as pd
-from bblocks.dataframe_tools.add import add_population_column, add_income_level_column
-from bblocks.cleaning_tools.clean import convert_id
-from scripts import config, common
+from scripts import config, common, countries, fetch, outputs, readers
 from scripts.logger import logger
-from bblocks import set_bblocks_data_path
-
-set_bblocks_data_path(config.PATHS.raw_data)
-
-from bblocks import set_bblocks_data_path
-
-set_bblocks_data_path(config.PATHS.raw_data)
+from scripts.profiling import profiled
 
 URLs = {
     "IBRD": "https://finances.worldbank.org/resource/rcx4-r7xj.csv",
     "IDA": "https://finances.worldbank.org/resource/v84d-dq44.csv",
 }
 
+# Institutions in the votes chart: the name shown in the chart and the order in
+# which income groups are sorted. Each institution needs an entry in URLs
+INSTITUTIONS: dict = {
+    "IBRD": (
+        "International Bank for Reconstruction and Development",
+        [
+            "High income",
+            "Upper middle income",
+            "Lower middle income",
+            "Low income",
+        ],
+    ),
+    "IDA": (
+        "International Development Association",
+        [
+            "High income",
+            "Lower middle income",
+            "Upper middle income",
+            "Low income",
+        ],
+    ),
+}
+
 
-def download_raw_data(dataset: str) -> None:
-    """Download the raw data from the WB"""
-    url = URLs[dataset]
-    pd.read_csv(url, parse_dates=["as_of_date"]).to_feather(
-        config.PATHS.raw_data / f"{dataset}_data.feather"
+def _save_raw_data(dataset: str, response: fetch.Response) -> None:
+    """Save a downloaded dataset, unless it is unchanged and already saved"""
+    path = config.PATHS.raw_data / f"{dataset}_data.feather"
+
+    if not response.modified and path.exists():
+        logger.info(f"{dataset} votes data unchanged")
+        return
+
+    pd.read_csv(io.BytesIO(response.content), parse_dates=["as_of_date"]).to_feather(
+        path
     )
 
     logger.info(f"Downloaded {dataset} votes data")
 
 
+def download_raw_data(dataset: str) -> None:
+    """Download the raw data from the WB"""
+    _save_raw_data(dataset, fetch.get(URLs[dataset]))
+
+
 def read_raw_data(dataset: str) -> pd.DataFrame:
     """Read the raw data from the WB"""
-    return pd.read_feather(config.PATHS.raw_data / f"{dataset}_data.feather")
+    return readers.read_cached(config.PATHS.raw_data / f"{dataset}_data.feather")
 
 
 def extract_as_of_date(df: pd.DataFrame) -> str:
@@ -37,25 +65,25 @@ def extract_as_of_date(df: pd.DataFrame) -> str:
     return df.as_of_date.max().strftime("%d %B %Y")
 
 
+@profiled
 def clean_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean the raw data from the WB"""
+    """Clean the raw data from the WB. The data of several institutions can be
+    cleaned at once if they are stacked with a `dataset` column"""
 
     df = df.rename(columns={"member": "member_country"})
 
     return (
-        df.filter(["member_country", "percentage_of_total_votes"])
-        .assign(name=lambda d: convert_id(d.member_country, to_type="short_name"))
-        .pipe(
-            add_population_column,
-            id_column="name",
-            id_type="regex",
-        )
-        .pipe(
-            add_income_level_column,
-            id_column="name",
-            id_type="regex",
+        df.filter(["member_country", "percentage_of_total_votes", "dataset"])
+        .pipe(countries.add_country_data, id_column="member_country")
+        .filter(
+            [
+                "name",
+                "percentage_of_total_votes",
+                "population",
+                "income_level",
+                "dataset",
+            ]
         )
-        .filter(["name", "percentage_of_total_votes", "population", "income_level"])
         .rename(columns={"percentage_of_total_votes": "Votes Share"})
         .sort_values("Votes Share", ascending=False)
         .reset_index(drop=True)
@@ -67,8 +95,10 @@ def ibrd_subscriptions() -> pd.DataFrame:
 
 
 def update_votes_data() -> None:
-    for dataset in URLs:
-        download_raw_data(dataset)
+    responses = fetch.get_many(list(URLs.values()))
+
+    for dataset, response in zip(URLs, responses):
+        _save_raw_data(dataset, response)
 
 
 def _rename_other_income(df: pd.DataFrame) -> pd.DataFrame:
@@ -84,15 +114,23 @@ def _rename_other_income(df: pd.DataFrame) -> pd.DataFrame:
     )
 
 
-def _sort_by_income(df: pd.DataFrame, dataset: str = "IBRD") -> pd.DataFrame:
-    income_sorting = {
-        "High income": 1,
-        "Upper middle income": 2 if dataset == "IBRD" else 3,
-        "Lower middle income": 3 if dataset == "IBRD" else 2,
-        "Low income": 4,
-    }
+@profiled
+def _sort_by_income(
+    df: pd.DataFrame, institutions: dict = INSTITUTIONS
+) -> pd.DataFrame:
+    """Sort each institution by income group, in the order set in `institutions`,
+    and then by votes share"""
+    income_sorting = pd.DataFrame(
+        [
+            (name, income_level, position)
+            for name, income_levels in institutions.values()
+            for position, income_level in enumerate(income_levels)
+        ],
+        columns=["dataset", "income_level", "income_sorting"],
+    )
+
     return (
-        df.assign(income_sorting=lambda d: d.income_level.map(income_sorting))
+        df.merge(income_sorting, on=["dataset", "income_level"], how="left")
         .sort_values(
             ["dataset", "income_sorting", "Votes Share"], ascending=(True, True, False)
         )
@@ -101,94 +139,101 @@ def _sort_by_income(df: pd.DataFrame, dataset: str = "IBRD") -> pd.DataFrame:
     )
 
 
+@profiled
 def _top_and_groups(
     df: pd.DataFrame, top: int = 9, highlight: list = None
 ) -> pd.DataFrame:
-    """From the clean data, get the top X countries, plus China,
-    and India, and group any remaining countries by income level"""
+    """From the clean data of one or more institutions (stacked, with a `dataset`
+    column), get the top X countries of each, plus China and India, and group any
+    remaining countries by income level"""
 
     # If no countries to highlight are provided, use China and India
     if highlight is None:
         highlight = ["China", "India"]
 
-    # Find the top X countries
-    top_members = df.nlargest(top, "Votes Share").name.to_list()
+    df = df.reset_index(drop=True)
 
-    # Create a dataframe with the top X countries
-    top_df = df[df.name.isin(top_members)]
-
-    # Create a dataframe with the remaining countries
-    not_top_df = df[~df.name.isin(top_members)]
-
-    # From the remaining countries, get highlight countries
-    highlight_countries = not_top_df.query(f"name in {highlight}")
+    # Rank members within each institution. Ties are ranked in order of
+    # appearance, like nlargest
+    rank = df.groupby("dataset", sort=False)["Votes Share"].rank(
+        method="first", ascending=False
+    )
 
-    # Create a dataframe with the remaining countries.
-    not_data = not_top_df.query(f"name not in {highlight}")
+    # 0: top X countries, 1: highlight countries, 2: everyone else
+    block = np.select([rank <= top, df.name.isin(highlight)], [0, 1], default=2)
 
-    # From the remaining countries, group by income level
-    not_data = (
-        not_data.groupby(["income_level", "dataset"])
+    # Group the remaining countries by income level
+    others = (
+        df.loc[block == 2]
+        .groupby(["income_level", "dataset"])
         .sum(numeric_only=True)
         .reset_index()
+        .assign(block=2)
     )
 
-    # Combine all data, and rename income levels
+    # Keep the institutions in the order they came in, each with its top
+    # countries first, then highlighted countries and then income groups
+    position = {dataset: i for i, dataset in enumerate(df.dataset.unique())}
+
     return (
-        pd.concat([top_df, highlight_countries, not_data], ignore_index=True)
+        pd.concat([df.assign(block=block).loc[block < 2], others], ignore_index=True)
+        .assign(position=lambda d: d.dataset.map(position))
+        .sort_values(["position", "block"], kind="stable")
+        .drop(columns=["position", "block"])
+        .reset_index(drop=True)
         .assign(name=lambda d: d["name"].fillna(d["income_level"]))
         .pipe(_rename_other_income)
     )
 
 
-def votes_chart_data():
-    """Prepare the data for the votes chart"""
-
-    # Get clean versions of the raw data
-    ida = (
-        read_raw_data("IDA")
-        .pipe(clean_data)
-        .assign(dataset="International Development Association")
-    )
-    ibrd = (
-        read_raw_data("IBRD")
-        .pipe(clean_data)
-        .assign(dataset="International Bank for Reconstruction and Development")
-    )
-
-    ida_grouped = _top_and_groups(ida, top=9, highlight=["China", "India"]).pipe(
-        _sort_by_income, dataset="IDA"
-    )
-    ibrd_grouped = _top_and_groups(ibrd, top=9, highlight=["China", "India"]).pipe(
-        _sort_by_income, dataset="IBRD"
+def _income_totals(df: pd.DataFrame) -> pd.DataFrame:
+    """Label each institution's income groups with their number of countries"""
+    return (
+        df.groupby(["dataset", "income_level"])
+        .size()
+        .reset_index(name="countries")
+        .assign(
+            label=lambda d: d.income_level
+            + " ("
+            + d.countries.astype(str)
+            + " countries)"
+        )
+        .drop(columns=["countries"])
     )
 
-    # Extract group counts
-    ida_totals = ida.groupby("income_level").size().to_dict()
-    ida_totals = {k: f"{k} ({v} countries)" for k, v in ida_totals.items()}
-    ibrd_totals = ibrd.groupby("income_level").size().to_dict()
-    ibrd_totals = {k: f"{k} ({v} countries)" for k, v in ibrd_totals.items()}
 
-    ida_grouped = ida_grouped.assign(
-        income_level=lambda d: d.income_level.map(ida_totals)
-    )
+@profiled
+def votes_chart_data(institutions: dict = INSTITUTIONS):
+    """Prepare the data for the votes chart"""
 
-    ibrd_grouped = ibrd_grouped.assign(
-        income_level=lambda d: d.income_level.map(ibrd_totals)
+    # Get clean versions of the raw data, for all institutions at once. Not all
+    # datasets call the member column the same
+    clean = pd.concat(
+        [
+            read_raw_data(dataset)
+            .rename(columns={"member": "member_country"})
+            .assign(dataset=name)
+            for dataset, (name, _) in institutions.items()
+        ],
+        ignore_index=True,
+    ).pipe(clean_data)
+
+    data = (
+        _top_and_groups(clean, top=9, highlight=["China", "India"])
+        .pipe(_sort_by_income, institutions=institutions)
+        .merge(_income_totals(clean), on=["dataset", "income_level"], how="left")
+        .assign(income_level=lambda d: d.label)
+        .drop(columns=["label"])
     )
 
-    # Combine the data
-    data = pd.concat([ibrd_grouped, ida_grouped], ignore_index=True)
-
     # Save the data
-    data.to_csv(config.PATHS.output / "wb_votes_data.csv", index=False)
+    outputs.export(data, "wb_votes_data")
 
     # Extract dates
-    ida_date = read_raw_data("IDA").pipe(extract_as_of_date)
-    ibrd_date = read_raw_data("IBRD").pipe(extract_as_of_date)
-
-    key_numbers = {"ida_date": ida_date, "ibrd_date": ibrd_date}
-
-    common.update_key_number(
-        path=config.PATHS.output / "world_bank_key_numbers.json", new_dict=key_numbers
-    )
+    with common.key_numbers(
+        config.PATHS.output / "world_bank_key_numbers.json"
+    ) as key_numbers:
+        for dataset in institutions:
+            key_numbers[f"{dataset.lower()}_date"] = read_raw_data(dataset).pipe(
+                extract_as_of_date
+            )
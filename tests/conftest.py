@@ -0,0 +1,104 @@
+"""Fixtures shared by the tests: temporary data folders and a local HTTP server
+standing in for the remote sources."""
+
+import http.server
+import threading
+import urllib.parse
+from dataclasses import dataclass
+from typing import Callable
+
+import pytest
+
+from scripts import config, logger
+
+
+@dataclass(frozen=True)
+class Request:
+    """A request received by the stand-in server"""
+
+    path: str
+    query: dict
+    headers: dict
+
+
+# request -> (status, headers, body)
+Handler = Callable[[Request], tuple[int, dict, bytes]]
+
+
+class StandIn:
+    """A local HTTP server that answers every GET with `handler` and records the
+    requests it receives"""
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self.requests: list[Request] = []
+
+        stand_in = self
+
+        class _RequestHandler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                url = urllib.parse.urlparse(self.path)
+                request = Request(
+                    path=url.path,
+                    query=dict(urllib.parse.parse_qsl(url.query)),
+                    headers=dict(self.headers),
+                )
+                stand_in.requests.append(request)
+
+                status, headers, body = stand_in.handler(request)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), _RequestHandler
+        )
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_log_file():
+    """Keep the tests from writing to the tracked scripts_log.log"""
+    logger.logger.removeHandler(logger.file_handler)
+    yield
+    logger.logger.addHandler(logger.file_handler)
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    """Point raw_data, the downloaded pages and the cache to a temporary folder"""
+    monkeypatch.setattr(config.PATHS, "raw_data", tmp_path)
+    monkeypatch.setattr(config.PATHS, "pages", tmp_path / ".pages")
+    monkeypatch.setattr(config.PATHS, "cache", tmp_path / ".cache")
+    return tmp_path
+
+
+@pytest.fixture
+def serve():
+    """Start stand-in servers with `serve(handler)`. They are stopped after the
+    test"""
+    servers = []
+
+    def start(handler: Handler) -> StandIn:
+        server = StandIn(handler)
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.close()
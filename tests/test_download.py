@@ -0,0 +1,185 @@
+import csv
+import functools
+import io
+import json
+
+import pandas as pd
+import pytest
+import requests
+
+from scripts import readers
+from scripts.world_bank_finances import download, loans_data
+
+COLUMNS: list = [
+    "end_of_period",
+    "loan_number",
+    "country",
+    "loan_status",
+    *loans_data.CUBE_VALUES,
+]
+
+
+def _rows(snapshots: list[str], loans: int = 12) -> list[dict]:
+    """Loan history rows as Socrata returns them: strings, with ISO dates"""
+    return [
+        {
+            "end_of_period": f"{snapshot}T00:00:00.000",
+            "loan_number": f"L{i:03d}",
+            "country": f"Country {i % 4}",
+            "loan_status": ["Repaid", "Disbursing"][i % 2],
+            **{column: f"{i * 1.5}" for column in loans_data.CUBE_VALUES},
+        }
+        for snapshot in snapshots
+        for i in range(loans)
+    ]
+
+
+class Socrata:
+    """Stand-in for the SODA endpoints used by download.py: row counts (json)
+    and pages (csv), with $limit, $offset and `end_of_period > '...'` $where
+    clauses. Pages at the offsets in `failing` answer 500."""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self.failing: set[int] = set()
+
+    def _matching(self, query: dict) -> list[dict]:
+        if "$where" not in query:
+            return self.rows
+        after = query["$where"].split("'")[1]
+        return [r for r in self.rows if r["end_of_period"] > after]
+
+    def __call__(self, request):
+        rows = self._matching(request.query)
+
+        if request.path.endswith(".json"):
+            return 200, {}, json.dumps([{"count": str(len(rows))}]).encode()
+
+        offset, limit = int(request.query["$offset"]), int(request.query["$limit"])
+        if offset in self.failing:
+            return 500, {}, b""
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=COLUMNS, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(rows[offset : offset + limit])
+        return 200, {"Content-Type": "text/csv"}, buffer.getvalue().encode()
+
+
+def _page_offsets(server) -> list[int]:
+    return sorted(
+        int(r.query["$offset"]) for r in server.requests if r.path.endswith(".csv")
+    )
+
+
+@pytest.fixture
+def socrata(serve, monkeypatch):
+    """A Socrata stand-in with three snapshots of 12 loans. Retries don't wait"""
+    monkeypatch.setattr(download.time, "sleep", lambda seconds: None)
+
+    api = Socrata(_rows(["2021-06-30", "2021-12-31", "2022-06-30"]))
+    return api, serve(api)
+
+
+def test_download_data_in_pages(paths, socrata):
+    api, server = socrata
+
+    download.download_data("abcd-1234", "loans", page_size=10, domain=server.url)
+
+    data = pd.read_feather(download.raw_data_path("loans"))
+    assert len(data) == 36
+    assert _page_offsets(server) == [0, 10, 20, 30]
+    assert data.loan_status.dtype == "category"
+    assert data.end_of_period.dtype == "datetime64[ns]"
+    assert not (paths / ".pages" / "loans").exists()
+
+
+def test_download_data_resumes_missing_pages(paths, socrata):
+    api, server = socrata
+    api.failing = {20}
+
+    with pytest.raises(requests.HTTPError):
+        download.download_data("abcd-1234", "loans", page_size=10, domain=server.url)
+
+    assert not download.raw_data_path("loans").exists()
+
+    api.failing = set()
+    server.requests.clear()
+    download.download_data("abcd-1234", "loans", page_size=10, domain=server.url)
+
+    # only the page that failed is downloaded again
+    assert _page_offsets(server) == [20]
+    data = pd.read_feather(download.raw_data_path("loans"))
+    assert data.loan_number.astype(str).tolist() == [r["loan_number"] for r in api.rows]
+
+
+def test_download_data_sends_where(paths, socrata):
+    api, server = socrata
+    where = "end_of_period > '2021-12-31T00:00:00.000'"
+
+    download.download_data(
+        "abcd-1234", "loans", page_size=10, domain=server.url, where=where
+    )
+
+    assert all(r.query["$where"] == where for r in server.requests)
+    data = pd.read_feather(download.raw_data_path("loans"))
+    assert data.end_of_period.unique().tolist() == [pd.Timestamp("2022-06-30")]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather"])
+def test_sync_loan_data_appends_new_snapshots(
+    paths, socrata, monkeypatch, output_format
+):
+    api, server = socrata
+    monkeypatch.setattr(
+        download,
+        "download_data",
+        functools.partial(download.download_data, domain=server.url, page_size=10),
+    )
+
+    # No local data: the full history is downloaded
+    loans_data.sync_loan_data(output_format=output_format)
+    assert all("$where" not in r.query for r in server.requests)
+
+    # Only the new snapshot is requested, and added to the stored data
+    api.rows += _rows(["2022-12-31"])
+    server.requests.clear()
+    loans_data.sync_loan_data(output_format=output_format)
+
+    assert {r.query["$where"] for r in server.requests} == {
+        "end_of_period > '2022-06-30T00:00:00.000'"
+    }
+    assert _page_offsets(server) == [0, 10]
+
+    data = loans_data.read_raw_data(loans_data.file_name)
+    assert len(data) == 48
+    assert data.end_of_period.max() == pd.Timestamp("2022-12-31")
+    assert loans_data.snapshot_index(loans_data.file_name).end_of_period.max() == (
+        pd.Timestamp("2022-12-31")
+    )
+
+    # Nothing new: the stored data and the cube are left as they are
+    stored = [
+        loans_data.raw_data_path(loans_data.file_name),
+        loans_data.cube_path(loans_data.file_name),
+    ]
+    modified = [readers.modified(path) for path in stored]
+    loans_data.sync_loan_data(output_format=output_format)
+    assert [readers.modified(path) for path in stored] == modified
+
+
+def test_sync_loan_data_converts_feather_history(paths, socrata, monkeypatch):
+    api, server = socrata
+    monkeypatch.setattr(
+        download,
+        "download_data",
+        functools.partial(download.download_data, domain=server.url, page_size=10),
+    )
+    loans_data.sync_loan_data(output_format="feather")
+
+    api.rows += _rows(["2022-12-31"])
+    loans_data.sync_loan_data()
+
+    assert not download.raw_data_path(loans_data.file_name).exists()
+    assert loans_data.raw_data_path(loans_data.file_name).is_dir()
+    assert len(loans_data.read_raw_data(loans_data.file_name)) == 48
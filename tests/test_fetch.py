@@ -0,0 +1,87 @@
+import json
+import time
+
+import pytest
+import requests
+
+from scripts import fetch
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Mar 2023 12:00:00 GMT"
+
+
+def _conditional(body: bytes = b"a,b\n1,2\n"):
+    """A resource that answers 304 when the client sends the current ETag"""
+
+    def handler(request):
+        if request.headers.get("If-None-Match") == ETAG:
+            return 304, {"ETag": ETAG}, b""
+        return 200, {"ETag": ETAG, "Last-Modified": LAST_MODIFIED}, body
+
+    return handler
+
+
+def test_get_stores_validators(paths, serve):
+    server = serve(_conditional())
+    url = f"{server.url}/data.csv"
+
+    response = fetch.get(url)
+
+    assert response == fetch.Response(content=b"a,b\n1,2\n", modified=True)
+
+    with open(fetch._validators_path(), "r") as f:
+        stored = json.load(f)[url]
+    assert stored["etag"] == ETAG
+    assert stored["last_modified"] == LAST_MODIFIED
+    assert (fetch._cache_dir() / stored["body"]).read_bytes() == b"a,b\n1,2\n"
+
+
+def test_get_sends_validators(paths, serve):
+    server = serve(_conditional())
+    url = f"{server.url}/data.csv"
+
+    fetch.get(url)
+    fetch.get(url)
+
+    first, second = server.requests
+    assert "If-None-Match" not in first.headers
+    assert second.headers["If-None-Match"] == ETAG
+    assert second.headers["If-Modified-Since"] == LAST_MODIFIED
+
+
+def test_get_returns_stored_body_when_not_modified(paths, serve):
+    server = serve(_conditional(b"stored"))
+    url = f"{server.url}/data.csv"
+
+    fetch.get(url)
+    server.handler = _conditional(b"should not be downloaded")
+
+    assert fetch.get(url) == fetch.Response(content=b"stored", modified=False)
+
+
+def test_get_without_validators_is_not_stored(paths, serve):
+    server = serve(lambda request: (200, {}, b"body"))
+
+    assert fetch.get(f"{server.url}/data.csv").modified
+    assert not fetch._validators_path().exists()
+
+
+def test_get_raises_on_errors(paths, serve):
+    server = serve(lambda request: (500, {}, b""))
+
+    with pytest.raises(requests.HTTPError):
+        fetch.get(f"{server.url}/data.csv")
+
+
+def test_get_many_keeps_url_order(paths, serve):
+    def handler(request):
+        # the first URLs are answered last
+        time.sleep(0.01 * (20 - int(request.path.strip("/"))))
+        return 200, {}, request.path.encode()
+
+    server = serve(handler)
+    urls = [f"{server.url}/{i}" for i in range(20)]
+
+    responses = fetch.get_many(urls)
+
+    assert [r.content for r in responses] == [f"/{i}".encode() for i in range(20)]